@@ -3,6 +3,7 @@ import time
 from environment import AgentEnv
 from mockAgent import MockAgent
 from config.config import AgentEnvConfig, LogConfig
+from utils.emulator_pool import EmulatorPool
 import os
 
 os.makedirs(LogConfig.LOG_FILE_PATH, exist_ok=True)
@@ -14,35 +15,71 @@ log_file_name = f"{LogConfig.LOG_FILE_PATH}/{time.time()}_out.log"
 #                     handlers=[logging.FileHandler(log_file_name, 'a'),
 #                               logging.StreamHandler()])
 
-# Initialize the Agent environment with configuration settings
-agent_env = AgentEnv(
-    avd_name=AgentEnvConfig.AVD_NAME,
-    emulator_controller_args=AgentEnvConfig.EMULATOR_CONTROLLER_AGRS,
-    max_steps=AgentEnvConfig.MAX_STEPS,
+
+def run_episodes(agent_env: AgentEnv) -> None:
+    agent = MockAgent()
+
+    # Main loop
+    while True:
+        '''
+        In this loop,you can get all interface that AgentEnv provice for agent to interact with.    
+        '''
+        instruction = agent_env.get_instruction()
+        if instruction is None:
+            break
+        logging.info(f"Current instruction: {instruction}")
+        agent_env.setup_task(instruction)
+        
+        while not agent_env.episode_done():
+            state = agent_env.get_state()
+            action = agent.get_action(state)
+            status = agent_env.post_action(action=action)
+            state_history = agent_env.get_state_history()
+            device_size = agent_env.get_device_size()
+        agent_env.get_state() # get the final state
+        agent_env.reset_env()
+
+
+# AgentEnv arguments shared by the pool workers and the single emulator run
+env_kwargs = dict(
     local_output_path=AgentEnvConfig.LOCAL_OUTPUT_PATH,
     instruction_fp=AgentEnvConfig.INSTRUCTION_FILE_PATH,
+    max_steps=AgentEnvConfig.MAX_STEPS,
+    readiness_deadlines=AgentEnvConfig.READINESS_DEADLINES,
+    settle_bounds=AgentEnvConfig.UI_SETTLE_BOUNDS,
+    fast_reset=AgentEnvConfig.FAST_RESET,
+    capture_workers=AgentEnvConfig.CAPTURE_WORKERS,
+    async_persistence=AgentEnvConfig.ASYNC_PERSISTENCE,
+    columnar_vh=AgentEnvConfig.COLUMNAR_VH,
+    annotate_actions=AgentEnvConfig.ANNOTATE_ACTIONS,
+    state_history_size=AgentEnvConfig.STATE_HISTORY_SIZE,
+    tracing=AgentEnvConfig.TRACING,
+    emulator_log_patterns=AgentEnvConfig.EMULATOR_LOG_PATTERNS,
+    schedule_episodes=AgentEnvConfig.SCHEDULE_EPISODES,
+    max_step_fp=AgentEnvConfig.MAX_STEP_FILE_PATH,
+    resume=AgentEnvConfig.RESUME,
+    setup_snapshot_cache_fp=AgentEnvConfig.SETUP_SNAPSHOT_CACHE_PATH,
+    trace_archive=AgentEnvConfig.TRACE_ARCHIVE,
+    trace_index_fp=AgentEnvConfig.TRACE_INDEX_PATH,
+    screenshot_encoding=AgentEnvConfig.SCREENSHOT_ENCODING,
 )
-agent_env.set_up()
-agent = MockAgent()
-
-# Main loop
-while True:
-    '''
-    In this loop,you can get all interface that AgentEnv provice for agent to interact with.    
-    '''
-    instruction = agent_env.get_instruction()
-    if instruction is None:
-        break
-    logging.info(f"Current instruction: {instruction}")
-    agent_env.setup_task(instruction)
-    
-    while not agent_env.episode_done():
-        state = agent_env.get_state()
-        action = agent.get_action(state)
-        status = agent_env.post_action(action=action)
-        state_history = agent_env.get_state_history()
-        device_size = agent_env.get_device_size()
-    agent_env.get_state() # get the final state
-    agent_env.reset_env()
 
-agent_env.tear_down()
+if AgentEnvConfig.EMULATOR_POOL_SIZE > 1:
+    # Run the instructions on several emulators in parallel, each worker drives its own AgentEnv
+    emulator_pool = EmulatorPool(
+        avd_name=AgentEnvConfig.AVD_NAME,
+        size=AgentEnvConfig.EMULATOR_POOL_SIZE,
+        emulator_controller_args=AgentEnvConfig.EMULATOR_CONTROLLER_AGRS,
+        base_port=AgentEnvConfig.EMULATOR_CONTROLLER_AGRS["port"],
+    )
+    emulator_pool.run(run_episodes, **env_kwargs)
+else:
+    # Initialize the Agent environment with configuration settings
+    agent_env = AgentEnv(
+        avd_name=AgentEnvConfig.AVD_NAME,
+        emulator_controller_args=AgentEnvConfig.EMULATOR_CONTROLLER_AGRS,
+        **env_kwargs,
+    )
+    agent_env.set_up()
+    run_episodes(agent_env)
+    agent_env.tear_down()
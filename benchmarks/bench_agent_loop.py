@@ -0,0 +1,183 @@
+"""
+End-to-end throughput of the AgentEnv loop on the offline ReplayDevice backend.
+
+    python -m benchmarks.bench_agent_loop [--trace captured_data_dir ...] [--rounds 3] [--output result.json]
+
+The loop is the one of MockAgent2AgentEnv.py, driven by the MockAgent action list (run --rounds
+times): get_state, post_action (executed, so the replay moves on), and get_state + reset_env at
+the end of every episode. Without --trace, a synthetic trace whose hierarchies have --nodes nodes
+is replayed. The output reports steps/sec and the p50/p95 latency of get_state, post_action,
+xml_string_to_json, parse_action_string and reset_env.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import environment
+from benchmarks.synthetic import write_synthetic_trace
+from environment import AgentEnv
+from mockAgent import MockAgent
+from replay_device import ReplayDevice, ReplayEmulatorController
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+class Timed:
+    """Callable wrapper recording the duration of every call of fn."""
+    def __init__(self, fn: Callable) -> None:
+        self.fn = fn
+        self.samples = []
+
+    def __call__(self, *args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return self.fn(*args, **kwargs)
+        finally:
+            self.samples.append(time.perf_counter() - start_time)
+
+
+def run_loop(agent_env: AgentEnv, actions: List[str], rounds: int) -> Dict[str, List[float]]:
+    """
+    Run the MockAgent2AgentEnv loop until the action list was replayed rounds times.
+
+    Returns:
+        dict: Samples (seconds) of get_state, post_action, reset_env and of the screenshot encoding.
+    """
+    samples = {"get_state": [], "post_action": [], "reset_env": [], "screenshot_encode": []}
+    agent = MockAgent()
+    agent.actions = list(actions) * rounds
+    while agent.index < len(agent.actions):
+        instruction = agent_env.get_instruction()
+        if instruction is None:
+            break
+        agent_env.setup_task(instruction)
+        while not agent_env.episode_done() and agent.index < len(agent.actions):
+            start_time = time.perf_counter()
+            state = agent_env.get_state()
+            samples["get_state"].append(time.perf_counter() - start_time)
+            action = agent.get_action(state)
+            start_time = time.perf_counter()
+            agent_env.post_action(action=action, do_execute=True)
+            samples["post_action"].append(time.perf_counter() - start_time)
+        start_time = time.perf_counter()
+        agent_env.get_state() # get the final state
+        samples["get_state"].append(time.perf_counter() - start_time)
+        step_timings = agent_env.get_step_timings()
+        start_time = time.perf_counter()
+        agent_env.reset_env() # flushes the pending writes, so every step has its screenshot_encode
+        samples["reset_env"].append(time.perf_counter() - start_time)
+        samples["screenshot_encode"].extend(timings["screenshot_encode"] for timings in step_timings
+                                            if "screenshot_encode" in timings)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser("benchmark the AgentEnv loop without emulator")
+    parser.add_argument("--trace", nargs="*", default=[], help="recorded episode or captured_data directories")
+    parser.add_argument("--nodes", type=int, nargs="+", default=[200, 800, 2000, 5000],
+                        help="node count of each step of the synthetic trace")
+    parser.add_argument("--rounds", type=int, default=3, help="times the MockAgent action list is replayed")
+    parser.add_argument("--instruction-fp", default="docs/instructions/llamatouch_task_metadata.tsv")
+    parser.add_argument("--capture-workers", type=int, default=3)
+    parser.add_argument("--async-persistence", action="store_true")
+    parser.add_argument("--columnar-vh", action="store_true")
+    parser.add_argument("--annotate-actions", action="store_true")
+    parser.add_argument("--state-history-size", type=int, default=None)
+    parser.add_argument("--trace-archive", action="store_true", help="write one captured_data.zip per episode")
+    parser.add_argument("--screenshot-encoding", type=json.loads, default=None,
+                        help='ScreenshotCodec arguments as JSON, e.g. \'{"format": "png", "compress_level": 1}\'')
+    parser.add_argument("--tracing", action="store_true", help="measure with the span tracer enabled")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_agent_loop_")
+    traces = [(trace, trace) for trace in args.trace]
+    if not traces:
+        traces = [("synthetic", write_synthetic_trace(os.path.join(work_dir, "trace"), args.nodes))]
+    actions = MockAgent().actions
+    # time the functions where AgentEnv looks them up
+    xml_string_to_json = Timed(environment.xml_string_to_json)
+    parse_action_string = Timed(environment.parse_action_string)
+    environment.xml_string_to_json = xml_string_to_json
+    environment.parse_action_string = parse_action_string
+
+    results = []
+    try:
+        for name, trace in traces:
+            device = ReplayDevice(trace)
+            agent_env = AgentEnv(
+                local_output_path=os.path.join(work_dir, "exec_output"),
+                instruction_fp=args.instruction_fp,
+                settle_bounds=(0, 0),
+                capture_workers=args.capture_workers,
+                async_persistence=args.async_persistence,
+                columnar_vh=args.columnar_vh,
+                annotate_actions=args.annotate_actions,
+                state_history_size=args.state_history_size,
+                tracing=args.tracing,
+                trace_archive=args.trace_archive,
+                screenshot_encoding=args.screenshot_encoding,
+                device=device,
+                emulator_controller=ReplayEmulatorController(device),
+            )
+            agent_env.set_up()
+            xml_string_to_json.samples, parse_action_string.samples = [], []
+            start_time = time.perf_counter()
+            samples = run_loop(agent_env, actions, args.rounds)
+            agent_env.artifact_writer.flush()
+            elapsed = time.perf_counter() - start_time
+            agent_env.state_capture.close()
+            agent_env.artifact_writer.close()
+
+            steps = len(samples["post_action"])
+            samples["xml_string_to_json"] = xml_string_to_json.samples
+            samples["parse_action_string"] = parse_action_string.samples
+            result = {
+                "trace": name,
+                "trace_steps": len(device.steps),
+                "trace_nodes": [step["view_hierarchy"].count("<node") for step in device.steps],
+                "steps": steps,
+                "episodes": len(samples["reset_env"]),
+                "elapsed_s": elapsed,
+                "steps_per_sec": steps / elapsed,
+                "latency": {function: summarize(values) for function, values in samples.items()},
+            }
+            results.append(result)
+            print(f"{name}: {steps} steps in {elapsed:.2f}s, {steps / elapsed:.1f} steps/sec")
+            for function, summary in result["latency"].items():
+                if summary["count"]:
+                    print(f"  {function:<20} n={summary['count']:<4} p50 {summary['p50_ms']:8.2f} ms  "
+                          f"p95 {summary['p95_ms']:8.2f} ms")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"config": vars(args), "results": results}, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark utils.transxml2vh.xml_string_to_json, which streams the dump through expat, against the
+previous converter that built an ElementTree, recursed over it and sorted the nodes. Both parse with
+expat configured the same way, so their output must be identical; the benchmark checks it.
+
+    python -m benchmarks.bench_transxml2vh [captured_data/**/xml/*.xml ...] [--repeat 20] [--output result.json]
+
+Without xml files, synthetic hierarchies of 500, 2000 and 5000 nodes are used.
+See also benchmarks/bench_agent_loop.py for the whole AgentEnv loop.
+"""
+import argparse
+import json
+import statistics
+import time
+import xml.etree.ElementTree as ET
+
+from benchmarks.synthetic import synthetic_view_hierarchy
+from utils.transxml2vh import xml_string_to_json
+
+
+def xml_string_to_json_etree(xml_string):
+    """The ElementTree + recursion + sort converter that xml_string_to_json replaced, kept as the baseline."""
+    root = ET.fromstring(xml_string)
+    node_id = 0
+    json_list = []
+
+    def process_node(node, parent_id=-1):
+        nonlocal node_id
+        current_id = node_id
+        node_id += 1
+        node_dict = {
+            "bounds": convert_bounds(node.get('bounds', '')),
+            "checkable": node.get('checkable', 'false') == 'true',
+            "checked": node.get('checked', 'false') == 'true',
+            "children": [],
+            "class": node.get('class',None),
+            "clickable": node.get('clickable', 'false') == 'true',
+            "content_description": node.get('content-desc', None),
+            "editable": False,
+            "enabled": node.get('enabled', 'true') == 'true',
+            "focusable": node.get('focusable', 'false') == 'true',
+            "focused": node.get('focused', 'false') == 'true',
+            "is_password": node.get('password', 'false') == 'true',
+            "long_clickable": node.get('long-clickable', 'false') == 'true',
+            "package": node.get('package', ''),
+            "parent": parent_id,
+            "resource_id": node.get('resource-id', None),
+            "scrollable": node.get('scrollable', 'false') == 'true',
+            "selected": node.get('selected', 'false') == 'true',
+            "size": "1080*2400",
+            "temp_id": current_id,
+            "text": node.get('text', None),
+            "visible": True,
+        }
+        child_nodes = list(node)
+        node_dict["child_count"] = len(child_nodes)
+        child_ids = []
+        for child in child_nodes:
+            child_dict = process_node(child, parent_id=current_id)
+            child_ids.append(child_dict["temp_id"])
+        node_dict["children"] = child_ids
+        json_list.append(node_dict)
+        return node_dict
+
+    def convert_bounds(bounds_str):
+        if bounds_str:
+            parts = bounds_str.replace('[', '').split(']')
+            start = list(map(int, parts[0].split(',')))
+            end = list(map(int, parts[1].split(',')))
+            return [start, end]
+        return [[0, 0], [0, 0]]
+
+    process_node(root)
+    return sorted(json_list, key=lambda x: x['temp_id'])
+
+
+def time_function(fn, xml_string, repeat):
+    samples = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        fn(xml_string)
+        samples.append(time.perf_counter() - start_time)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser("benchmark the view hierarchy converter")
+    parser.add_argument("xml_files", nargs="*", help="recorded captured_data/xml/*.xml files")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    inputs = []
+    for xml_file in args.xml_files:
+        with open(xml_file, "r", encoding="utf-8") as file:
+            inputs.append((xml_file, file.read()))
+    if not inputs:
+        inputs = [(f"synthetic_{n}", synthetic_view_hierarchy(n)) for n in (500, 2000, 5000)]
+
+    results = []
+    for name, xml_string in inputs:
+        expected = xml_string_to_json_etree(xml_string)
+        if xml_string_to_json(xml_string) != expected:
+            raise AssertionError(f"xml_string_to_json output differs from the baseline on {name}")
+        baseline = time_function(xml_string_to_json_etree, xml_string, args.repeat)
+        streaming = time_function(xml_string_to_json, xml_string, args.repeat)
+        results.append({
+            "input": name,
+            "nodes": len(expected),
+            "etree_ms": baseline * 1000,
+            "streaming_ms": streaming * 1000,
+            "speedup": baseline / streaming,
+        })
+        print(f"{name}: {len(expected)} nodes, etree {baseline * 1000:.2f} ms, "
+              f"streaming {streaming * 1000:.2f} ms, x{baseline / streaming:.2f}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
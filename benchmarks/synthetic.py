@@ -0,0 +1,101 @@
+import os
+import random
+import re
+from typing import Sequence
+from xml.sax.saxutils import quoteattr
+
+from PIL import Image, ImageDraw
+
+_CLASSES = [
+    "android.widget.FrameLayout",
+    "android.widget.LinearLayout",
+    "android.widget.TextView",
+    "android.widget.ImageView",
+    "android.widget.Button",
+    "androidx.recyclerview.widget.RecyclerView",
+    "android.view.ViewGroup",
+]
+
+
+def synthetic_view_hierarchy(n_nodes: int, seed: int = 0, width: int = 1080, height: int = 2400) -> str:
+    """
+    Build a uiautomator2-like view hierarchy dump with n_nodes nodes, for benchmarking when
+    no recorded captured_data/xml files are at hand.
+    """
+    rng = random.Random(seed)
+    lines = ["<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>", '<hierarchy rotation="0">']
+    made = 0
+
+    def node_attrs(index, x0, y0, x1, y1):
+        clickable = rng.random() < 0.3
+        return " ".join([
+            f'index="{index}"',
+            f"text={quoteattr(rng.choice(['', 'Settings', 'Search, or type URL', 'OK']))}",
+            f'resource-id="com.example:id/view_{rng.randrange(200)}"',
+            f'class="{rng.choice(_CLASSES)}"',
+            'package="com.example"',
+            'content-desc=""',
+            'checkable="false"',
+            'checked="false"',
+            f'clickable="{str(clickable).lower()}"',
+            'enabled="true"',
+            f'focusable="{str(clickable).lower()}"',
+            'focused="false"',
+            f'scrollable="{str(rng.random() < 0.05).lower()}"',
+            'long-clickable="false"',
+            'password="false"',
+            'selected="false"',
+            f'bounds="[{x0},{y0}][{x1},{y1}]"',
+        ])
+
+    def emit(x0, y0, x1, y1, depth):
+        nonlocal made
+        made += 1
+        lines.append(f"<node {node_attrs(made, x0, y0, x1, y1)}>")
+        # wide near the root, then a bit less than one child per node so the tree stays shallow
+        while made < n_nodes and rng.random() < (0.9 if depth < 4 else 0.45):
+            cx0 = rng.randint(x0, max(x0, x1 - 1))
+            cy0 = rng.randint(y0, max(y0, y1 - 1))
+            emit(cx0, cy0, rng.randint(cx0, x1), rng.randint(cy0, y1), depth + 1)
+        lines.append("</node>")
+
+    while made < n_nodes:
+        emit(0, 0, width, height, 1)
+    lines.append("</hierarchy>")
+    return "".join(lines)
+
+
+def synthetic_screenshot(view_hierarchy: str, seed: int = 0, width: int = 1080, height: int = 2400) -> Image.Image:
+    """
+    Draw the node bounds of a view hierarchy as filled boxes, a screenshot that compresses about
+    like a real app screen (flat areas and sharp edges) rather than like a plain color or noise.
+    """
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (250, 250, 250))
+    draw = ImageDraw.Draw(image)
+    for x0, y0, x1, y1 in re.findall(r'bounds="\[(\d+),(\d+)\]\[(\d+),(\d+)\]"', view_hierarchy):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.rectangle((int(x0), int(y0), int(x1), int(y1)), fill=color, outline=(0, 0, 0))
+    return image
+
+
+def write_synthetic_trace(trace_path: str, node_counts: Sequence[int], width: int = 1080, height: int = 2400) -> str:
+    """
+    Write a captured_data trace with one step per entry of node_counts (xml, activity and
+    screenshot), in the layout AgentEnv records and ReplayDevice replays.
+
+    Returns:
+        str: The captured_data directory.
+    """
+    captured_data_path = os.path.join(trace_path, "captured_data")
+    for subdir in ("xml", "activity", "screenshot"):
+        os.makedirs(os.path.join(captured_data_path, subdir), exist_ok=True)
+    for step, n_nodes in enumerate(node_counts):
+        view_hierarchy = synthetic_view_hierarchy(n_nodes, seed=step, width=width, height=height)
+        with open(os.path.join(captured_data_path, "xml", f"{step}.xml"), "w", encoding="utf-8") as file:
+            file.write(view_hierarchy)
+        with open(os.path.join(captured_data_path, "activity", f"{step}.activity"), "w", encoding="utf-8") as file:
+            file.write("com.example/.MainActivity")
+        synthetic_screenshot(view_hierarchy, seed=step, width=width, height=height).save(
+            os.path.join(captured_data_path, "screenshot", f"{step}.png"))
+    return captured_data_path
@@ -25,6 +25,104 @@ class AgentEnvConfig:
             - "port": Port number to use for adb connecting to the emulator.
             - "no-window": A boolean string ('true' or 'false') indicating whether the emulator should
               run without opening a GUI window. Useful for running tests in a headless environment.
+
+        EMULATOR_POOL_SIZE (int): Number of emulator instances run in parallel. With more than one,
+            instances listen on consecutive even ports starting from EMULATOR_CONTROLLER_AGRS["port"]
+            and all take their episodes from one shared instruction queue.
+
+        READINESS_DEADLINES (dict): Deadline in seconds of each stage of the readiness probe that
+            replaces the fixed sleeps after an emulator (re)load:
+            - "boot_completed": `sys.boot_completed` is set.
+            - "package_manager": the package manager answers.
+            - "uiautomator": the uiautomator2 server answers.
+
+        UI_SETTLE_BOUNDS (tuple): (min, max) seconds to wait after an executed action. Within these
+            bounds AgentEnv returns as soon as the view hierarchy stops changing.
+
+        FAST_RESET (bool): Reset episodes by loading the snapshot in place through the emulator
+            console (`avd snapshot load`) instead of killing and relaunching the emulator. A full
+            relaunch is still done when the in-place load fails.
+
+        CAPTURE_WORKERS (int): Number of threads reading the view hierarchy, top activity and
+            screenshot concurrently in get_state. 1 reads them one after another.
+
+        ASYNC_PERSISTENCE (bool): Write the captured_data artifacts from a background thread so that
+            PNG encoding and JSON dumping do not delay get_state and post_action. Pending writes are
+            flushed when the episode is done and on reset. Note that the files behind the paths of a
+            state may not exist yet when get_state returns.
+
+        COLUMNAR_VH (bool): Return the view hierarchy of each state as a ColumnarViewHierarchy
+            (numpy columns for bounds, flags and tree structure) under "view_hierarchy_columnar",
+            for vectorized filtering of the nodes, instead of the JSON list under "view_hierarchy_json"
+            (still saved to view_hierarchy_json_path, and given back by to_json()).
+
+        ANNOTATE_ACTIONS (bool): Hit-test every CLICK and SWIPE against the view hierarchy of the
+            last state, save the element it targets to captured_data/action_target/<step>.target and
+            log a warning when no clickable element is hit.
+
+        STATE_HISTORY_SIZE (int): Number of the most recent states of an episode kept fully in
+            memory by get_state_history. Older states only keep their paths and reload their
+            screenshot and view hierarchies from the saved files when accessed. None keeps every
+            state in memory. Screenshots saved lossy or resized (see SCREENSHOT_ENCODING) stay in
+            memory, since they would not be reloaded as captured.
+
+        TRACING (bool): Record timing spans around get_state, post_action, reset_env, every device
+            call and every artifact write, and append them as Chrome trace events to a
+            timeline.jsonl file next to the captured_data directory of each episode.
+
+        SCHEDULE_EPISODES (bool): Run the instructions grouped by app and login category instead of
+            in file order, so that the episodes of an app (and of its setup) run back to back; the
+            groups by their longest episode and the episodes within each group longest first, so
+            that only short episodes are left at the end and parallel workers finish together.
+            Every episode is still reset to default_boot, grouping does not save resets.
+
+        MAX_STEP_FILE_PATH (str): JSON file with the number of steps of each recorded episode
+            (see PrepareApps.extract_max_step_to_json), used to estimate the episode lengths.
+            The nsteps column of the instruction file is used for the episodes it lacks.
+
+        RESUME (bool): Record the status, step count, timings and output path of every episode in
+            LOCAL_OUTPUT_PATH/run_ledger.json. When the run is started again, completed episodes are
+            skipped, and episodes that were started but not completed are run again, their partial
+            output moved to <LOCAL_OUTPUT_PATH>.incomplete/<category>/<episode>.<timestamp> first.
+            Off by default: a second run over the same LOCAL_OUTPUT_PATH must ask for it.
+
+        EMULATOR_LOG_PATTERNS (dict): Regexes matched against each line of the emulator output
+            while it starts ("{snapshot}" stands for the snapshot name). The first "failure" match
+            makes the launch fail and be retried, the first "success" match ends the wait at once.
+            With no match within 30 seconds the launch is considered successful. None uses
+            DEFAULT_LOG_PATTERNS of utils/emulator_log.py.
+
+        SETUP_SNAPSHOT_CACHE_PATH (str): JSON index of the emulator snapshots saved right after a task
+            setup (setup/tasks) succeeded, keyed by AVD, setup class and app version. Later episodes
+            of the same instruction load the snapshot (`avd snapshot load`) instead of running the
+            setup again. Read-only emulators (EMULATOR_POOL_SIZE > 1) only load snapshots, so run the
+            setups once on a single emulator to fill the cache. None (the default) disables the cache;
+            every snapshot is a full emulator state, several GB in the AVD directory, so enable it
+            with e.g. "setup_snapshots.json" only where that space is available.
+
+        TRACE_ARCHIVE (bool): Store the screenshots, view hierarchies, activities, actions and action
+            targets of each episode in one uncompressed zip, <episode>/captured_data.zip, instead of
+            thousands of small files under captured_data/. utils.trace_archive.TraceArchive reads
+            any step in place and export_trace_archive restores the directory layout.
+
+        TRACE_INDEX_PATH (str): SQLite database indexing every recorded step (action type, normalized
+            points, typed text, top activity, view hierarchy hash, artifact paths) and episode (length,
+            last action, whether it hit MAX_STEPS) as they are written, for queries across runs.
+            Existing captured_data trees are indexed with `python -m utils.trace_index <root>`.
+            None disables the index.
+
+        SCREENSHOT_ENCODING (dict): How get_state saves screenshots, the arguments of
+            utils.screenshot_codec.ScreenshotCodec:
+            - "format": "png", "webp", "jpeg" or "raw" (uncompressed RGB .npy, re-encode it later
+              with transcode_screenshots).
+            - "compress_level": 0 (fastest) to 9 for PNG, PIL uses 6 when unset.
+            - "lossless" (WebP) and "quality" (WebP, JPEG), lossy formats only suit training captures.
+            - "scale" or "size" (width, height) to downscale the saved screenshots. The state returned
+              to the agent keeps the full size screenshot.
+            get_state_history returns the captured screenshots whatever the encoding: with a lossy or
+            resizing encoding the older states keep their screenshot in memory instead of reloading it
+            from the saved file, so STATE_HISTORY_SIZE only bounds their view hierarchies.
+            The time spent encoding each screenshot is reported as "screenshot_encode" in the step timings.
     """
     LOCAL_OUTPUT_PATH = "captured_data"
     # INSTRUCTION_FILE_PATH = "docs/instructions/llamatouch_task_metadata.csv"
@@ -36,6 +134,31 @@ class AgentEnvConfig:
         "port" : "5554",
         "no-window" : "true",  # Change this to "true" to run the emulator without GUI.
     }
+    EMULATOR_POOL_SIZE = 1
+    READINESS_DEADLINES = {
+        "boot_completed": 120,
+        "package_manager": 30,
+        "uiautomator": 30,
+    }
+    UI_SETTLE_BOUNDS = (0.5, 5.0)
+    FAST_RESET = True
+    CAPTURE_WORKERS = 3
+    ASYNC_PERSISTENCE = True
+    COLUMNAR_VH = False
+    ANNOTATE_ACTIONS = True
+    STATE_HISTORY_SIZE = 3
+    TRACING = False
+    SCHEDULE_EPISODES = True
+    RESUME = False
+    MAX_STEP_FILE_PATH = "max_step.json"
+    SETUP_SNAPSHOT_CACHE_PATH = None
+    TRACE_ARCHIVE = False
+    TRACE_INDEX_PATH = "captured_data/trace_index.sqlite"
+    SCREENSHOT_ENCODING = {
+        "format": "png",
+        "compress_level": 1,
+    }
+    EMULATOR_LOG_PATTERNS = None
 
 class LogConfig:
     """
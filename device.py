@@ -1,11 +1,88 @@
 import logging
+from abc import ABC, abstractmethod
 from typing import List
 import time
 import uiautomator2 as u2
 import subprocess
+import zlib
 
 
-class Device(object):
+class BaseDevice(ABC):
+    """
+    Interface AgentEnv drives a device through.
+
+    Device talks to a real (emulated) phone with uiautomator2, ReplayDevice (replay_device.py) replays
+    a recorded captured_data trace in process. Coordinates are in pixels.
+    """
+    serial: str = None
+    u2d = None # uiautomator2 device used by the task set up scripts, None when there is no real device
+
+    @abstractmethod
+    def connect(self) -> None:
+        pass
+
+    @abstractmethod
+    def disconnect(self) -> None:
+        pass
+
+    @abstractmethod
+    def ping(self) -> bool:
+        pass
+
+    @abstractmethod
+    def get_viewhierachy(self) -> str:
+        pass
+
+    @abstractmethod
+    def get_ui_fingerprint(self) -> int:
+        pass
+
+    @abstractmethod
+    def get_screenshot(self):
+        pass
+
+    @abstractmethod
+    def get_screen_size(self) -> tuple[int, int]:
+        pass
+
+    @abstractmethod
+    def get_top_activity_name(self) -> str:
+        pass
+
+    @abstractmethod
+    def get_installed_apps(self) -> List[str]:
+        pass
+
+    @abstractmethod
+    def click(self, x: int, y: int):
+        pass
+
+    @abstractmethod
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration=0.5):
+        pass
+
+    @abstractmethod
+    def input_text(self, text: str):
+        pass
+
+    @abstractmethod
+    def enter(self):
+        pass
+
+    @abstractmethod
+    def home(self):
+        pass
+
+    @abstractmethod
+    def back(self):
+        pass
+
+    @abstractmethod
+    def adb_shell(self, cmd: str):
+        pass
+
+
+class Device(BaseDevice):
 
     def __init__(self, device_serial: str) -> None:
         """
@@ -42,10 +119,23 @@ class Device(object):
         self.u2d.stop_uiautomator()
         self.logger.info("Disconnected from device.")
 
+    def ping(self) -> bool:
+        """
+        Check that the uiautomator2 server answers an RPC.
+        """
+        return bool(self.u2d.info)
+
     def get_viewhierachy(self) -> None:
         viewhierachy = self.u2d.dump_hierarchy(compressed=False, pretty=False, max_depth=50)
         return viewhierachy
     
+    def get_ui_fingerprint(self) -> int:
+        """
+        Cheap fingerprint of the current screen: a crc32 of the compressed view hierarchy.
+        """
+        viewhierachy = self.u2d.dump_hierarchy(compressed=True, pretty=False, max_depth=50)
+        return zlib.crc32(viewhierachy.encode("utf-8"))
+
     def get_screenshot(self) -> None:
         screenshot = self.u2d.screenshot()
         return screenshot
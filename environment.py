@@ -1,17 +1,36 @@
 from typing import Any, Dict, Iterator
 import os
-from device import Device
+import queue
+from device import BaseDevice, Device
 import time
 import logging
 import pandas as pd
 import json
 import re
+import shutil
 import subprocess
 
 from utils.parse_action import parse_action_string, parse_action
 from utils.emulator_controller import EmulatorController
-from setup.tasks.TaskSetUp import TaskSetUp
+from utils.adb_client import AdbError, get_adb_client
+from setup.tasks.TaskSetUp import TaskSetUp, get_task_setup_class
 from utils.transxml2vh import xml_string_to_json
+from utils.ui_settle import UISettleDetector
+from utils.state_capture import StateCapture
+from utils.artifact_writer import ArtifactWriter, AsyncArtifactWriter
+from utils.columnar_vh import ColumnarViewHierarchy
+from utils.spatial_index import ViewHierarchyIndex
+from utils.tracing import Tracer, TracedDevice
+from utils.episode_scheduler import load_max_steps, schedule_instructions
+from utils.run_ledger import STARTED, open_run_ledger
+from utils.setup_snapshot_cache import open_setup_snapshot_cache
+from utils.trace_archive import TraceArchiveWriter
+from utils.trace_index import TraceIndex
+from utils.screenshot_codec import ScreenshotCodec
+from utils.state_history import StateHistory
+
+# snapshot reloads tried by reset_env before the emulator is relaunched from scratch
+_RESET_ATTEMPTS = 2
 
 class PrepareApps:
     def __init__(self, device_serial) -> None:
@@ -20,19 +39,15 @@ class PrepareApps:
     
     def get_apk_path(self, package_name):
     # 获取 APK 文件路径
-        result = subprocess.run(
-            ["adb", "-s", self.device_serial, "shell", "pm", "path", package_name],
-            capture_output=True,
-            text=True
-        )
-        if result.returncode == 0:
-            apk_path = result.stdout.strip().replace("package", "")
-            if apk_path:
-                return apk_path.split(":")[1].strip()
-            else:
-                raise Exception(f"APK path not found for package: {package_name}")
+        try:
+            output = get_adb_client().shell(self.device_serial, f"pm path {package_name}")
+        except AdbError as e:
+            raise Exception(f"Failed to get APK path for package: {package_name}") from e
+        apk_path = output.strip().replace("package", "")
+        if apk_path.startswith(":"):
+            return apk_path.split(":")[1].strip()
         else:
-            raise Exception(f"Failed to get APK path for package: {package_name}")
+            raise Exception(f"APK path not found for package: {package_name}")
 
     def pull_apk(self, apk_path, local_path):
         # 将 APK 文件从设备中拉取到本地
@@ -190,46 +205,139 @@ class PrepareApps:
                 
 
 
+def generate_instructions(instructions: pd.DataFrame, local_output_path: str) -> Iterator[tuple[str, str]]:
+    """
+    Yield (description, gr_path, app_short, episode, output_path) for every row of the instruction table.
+    """
+    for _, row in instructions.iterrows(): # add: gr_path, app_short, episode,
+        yield row['description'], row['path'], row['app'], row['episode'], os.path.join(local_output_path, row['category'], str(row['episode']))
+
+
 class AgentEnv:
     def __init__(self, avd_name = None, emulator_controller_args=None,\
-                 max_steps=30,local_output_path="exec_output",instruction_fp="docs/instructions/llamatouch_task_metadata.tsv") -> None:
+                 max_steps=30,local_output_path="exec_output",instruction_fp="docs/instructions/llamatouch_task_metadata.tsv",
+                 instruction_queue: queue.Queue = None, readiness_deadlines: Dict[str, float] = None,
+                 settle_bounds: tuple[float, float] = (0.5, 5.0), fast_reset: bool = False,
+                 capture_workers: int = 3, async_persistence: bool = False,
+                 columnar_vh: bool = False, annotate_actions: bool = False, state_history_size: int = None,
+                 device: BaseDevice = None, emulator_controller=None, tracing: bool = False,
+                 emulator_log_patterns: Dict[str, list[str]] = None, schedule_episodes: bool = False,
+                 max_step_fp: str = "max_step.json", resume: bool = False,
+                 setup_snapshot_cache_fp: str = None, trace_archive: bool = False, trace_index_fp: str = None,
+                 screenshot_encoding: Dict[str, Any] = None) -> None:
         
         self.current_episode = None
+        self.current_instruction = None # the tuple of the instruction being run, as taken from the instructions
         self.task_output_path = None #包含category和episode的路径
-        self.device_serial = f"emulator-{emulator_controller_args['port']}"
         self.logger = logging.getLogger(self.__class__.__name__)
         self.local_output_path = local_output_path
         os.makedirs(self.local_output_path, exist_ok=True)
-        self.device = Device(device_serial=self.device_serial)
-        self.emulator_controller = EmulatorController(avd_name=avd_name,device_serial=self.device_serial,params=emulator_controller_args)
+        # device and emulator_controller replace the uiautomator2 Device and the emulator, e.g. by a
+        # ReplayDevice and its ReplayEmulatorController to run without emulator
+        if device is not None:
+            self.device_serial = device.serial
+            self.device = device
+        else:
+            self.device_serial = f"emulator-{emulator_controller_args['port']}"
+            self.device = Device(device_serial=self.device_serial)
+        if emulator_controller is not None:
+            self.emulator_controller = emulator_controller
+        else:
+            self.emulator_controller = EmulatorController(avd_name=avd_name,device_serial=self.device_serial,params=emulator_controller_args,
+                                                          readiness_deadlines=readiness_deadlines, fast_reset=fast_reset,
+                                                          log_patterns=emulator_log_patterns)
+        # spans of the episode, appended to timeline.jsonl next to captured_data at each episode boundary
+        self.tracer = Tracer(enabled=tracing)
+        if tracing:
+            self.device = TracedDevice(self.device, self.tracer)
+        self.boot_latency = None # latency of each readiness stage of the last emulator (re)load
+        # waits after an executed action until the screen stops changing, between settle_bounds seconds
+        self.settle_detector = UISettleDetector(self.device, min_wait=settle_bounds[0], max_wait=settle_bounds[1])
+        # reads view hierarchy, activity and screenshot concurrently in get_state
+        self.state_capture = StateCapture(self.device, max_workers=capture_workers)
+        # persists captured_data/* artifacts, in a background thread with async_persistence,
+        # into one captured_data.zip per episode instead of one file per artifact with trace_archive
+        self.trace_archive = trace_archive
+        # format, compression and size of the saved screenshots, see ScreenshotCodec; PNG at PIL's defaults by default
+        self.screenshot_codec = ScreenshotCodec(**(screenshot_encoding or {}))
+        artifact_sink = (TraceArchiveWriter(self.tracer, self.screenshot_codec) if trace_archive
+                         else ArtifactWriter(self.tracer, self.screenshot_codec))
+        self.artifact_writer = AsyncArtifactWriter(artifact_sink) if async_persistence else artifact_sink
+        self.columnar_vh = columnar_vh # put a ColumnarViewHierarchy in the states instead of the JSON view hierarchy
+        # hit-test clicks and swipes against the last state and save the element they target next to the action
+        self.annotate_actions = annotate_actions
+        self._target_index = (None, None) # (view_hierarchy_json_path, ViewHierarchyIndex) of the last state
+        # number of states kept fully in memory, older ones are reloaded from their files on access; None keeps all
+        self.state_history_size = state_history_size
         
         self.instructions = pd.read_csv(instruction_fp, sep='\t')
+        if schedule_episodes:
+            # run the episodes of an app back to back, long episodes first
+            self.instructions = schedule_instructions(self.instructions, load_max_steps(max_step_fp))
         self.instruction_generator = self._generate_instruction()
+        # shared by all workers of an EmulatorPool, instructions are then taken from it instead of instruction_fp
+        self.instruction_queue = instruction_queue
         self.max_steps = max_steps
+        # records the episodes in local_output_path/run_ledger.json, completed ones are skipped when the run is resumed
+        self.run_ledger = open_run_ledger(os.path.join(local_output_path, "run_ledger.json")) if resume else None
+        # emulator snapshots taken after a task setup succeeded, restored instead of running the setup again
+        self.setup_snapshot_cache = open_setup_snapshot_cache(setup_snapshot_cache_fp) if setup_snapshot_cache_fp else None
+        # SQLite index of the recorded steps and episodes, filled as the artifacts are written
+        self.trace_index = TraceIndex(trace_index_fp) if trace_index_fp else None
         
 
 
 
         self.current_action = "None|None|None"
-        self.state_history = []
+        self.state_history = self._new_state_history()
+        self.settle_latencies = [] # [{"step", "action_type", "latency", "stable"}] of the executed actions of the episode
+        self.step_timings = [] # per get_state call of the episode, seconds spent on each field, see get_step_timings
         self.episode_end = False
         self.current_steps = 0
     
 
+    def _new_state_history(self) -> StateHistory:
+        return StateHistory(max_in_memory=self.state_history_size, before_load=self.artifact_writer.flush,
+                            screenshot_codec=self.screenshot_codec)
+
     def _generate_instruction(self) -> Iterator[tuple[str, str]]:
-        for _, row in self.instructions.iterrows(): # add: gr_path, app_short, episode,
-            yield row['description'], row['path'], row['app'], row['episode'], os.path.join(self.local_output_path, row['category'], str(row['episode']))
+        yield from generate_instructions(self.instructions, self.local_output_path)
 
+    def _next_instruction(self) -> tuple:
+        if self.instruction_queue is None:
+            return next(self.instruction_generator)
+        try:
+            return self.instruction_queue.get_nowait()
+        except queue.Empty:
+            raise StopIteration
 
-    def _setup_directories(self, base_path, subdirectories) -> list[str]:
+
+    def _setup_directories(self, base_path, subdirectories, archived=False) -> list[str]:
+        """
+        Paths of the captured_data subdirectories, created unless archived is set (their artifacts
+        are all written through artifact_writer) and the episode is archived.
+        """
         paths = []
-        for subdir in subdirectories:
-            dir_path = os.path.join(base_path, f'captured_data/{subdir}')
-            os.makedirs(dir_path, exist_ok=True)
-            paths.append(dir_path)
+        with self.tracer.span("_setup_directories"):
+            for subdir in subdirectories:
+                dir_path = os.path.join(base_path, f'captured_data/{subdir}')
+                if not (archived and self.trace_archive):
+                    os.makedirs(dir_path, exist_ok=True)
+                paths.append(dir_path)
         return paths
+
+    def _flush_timeline(self) -> None:
+        """
+        Append the spans traced so far to timeline.jsonl of the current episode (of local_output_path before the first one).
+        """
+        if self.tracer.enabled:
+            self.tracer.flush(os.path.join(self.task_output_path or self.local_output_path, "timeline.jsonl"))
     
     def _execute_action(self, action_type, action_para) -> bool:
+        with self.tracer.span("_execute_action", action_type=action_type):
+            return self._execute_device_action(action_type, action_para)
+
+    def _execute_device_action(self, action_type, action_para) -> bool:
         status = None
         w, h = self.device.get_screen_size()
         if action_type == "CLICK":
@@ -247,6 +355,35 @@ class AgentEnv:
             status = self.device.home()
         return status
 
+    def _locate_action_target(self, action_para) -> Dict[str, Any]:
+        """
+        Find the element under the (first) point of a CLICK or SWIPE in the last captured state.
+
+        Returns:
+            dict: the point in pixels, the top-most element hit, the clickable element handling the touch
+            (the element itself or its closest clickable ancestor) and whether there is one; None without state.
+        """
+        if not self.state_history:
+            return None
+        state = self.state_history[-1]
+        key, index = self._target_index
+        if key != state["view_hierarchy_json_path"]:
+            view_hierarchy_columnar = state.get("view_hierarchy_columnar")
+            if view_hierarchy_columnar is None:
+                view_hierarchy_columnar = ColumnarViewHierarchy.from_json(state["view_hierarchy_json"])
+            index = ViewHierarchyIndex(view_hierarchy_columnar)
+            self._target_index = (state["view_hierarchy_json_path"], index)
+        w, h = self.device.get_screen_size()
+        x, y = action_para[0] * w, action_para[1] * h
+        element = index.hit_test(x, y)
+        interactive_element = index.interactive_ancestor(element) if element is not None else None
+        return {
+            "point": [x, y],
+            "element": index.describe(element) if element is not None else None,
+            "interactive_element": index.describe(interactive_element) if interactive_element is not None else None,
+            "valid": interactive_element is not None,
+        }
+
     def _trans_action_format(self,action_type, action_para) -> Any:
 
         width, height = self.get_device_size()
@@ -270,6 +407,17 @@ class AgentEnv:
         else:
             raise ValueError("action_type not supported")
     
+    def _connect_device(self, boot_latency: Dict[str, float] = None) -> None:
+        """
+        Connect to the device and wait until its uiautomator server answers.
+        """
+        self.device.connect()
+        uiautomator_latency = self.emulator_controller.readiness_probe.wait_for_uiautomator(self.device)
+        self.boot_latency = dict(boot_latency or {})
+        self.boot_latency["uiautomator"] = uiautomator_latency
+        self.boot_latency["total"] = self.boot_latency.get("total", 0) + uiautomator_latency
+        self.logger.info(f"device ready, boot latency: {self.boot_latency}")
+
     def _backtohome(self) -> None:
         self.device.home()
     
@@ -282,14 +430,17 @@ class AgentEnv:
                     self.logger.info("loading emulator failed, retrying...")
                     is_new_load=self.emulator_controller.load_emulator_with_snapshot()
                     time.sleep(10)
+                boot_latency = None
                 if is_new_load==1:
                     self.logger.info("emulator loaded newly successfully!")
-                    time.sleep(30) # waiting for emulator to start
+                    boot_latency = self.emulator_controller.wait_until_ready() # waiting for emulator to start
                 self.logger.info("connecting to device...")
-                self.device.connect()
+                self._connect_device(boot_latency)
                 self._backtohome()
-                time.sleep(2)
+                with self.tracer.span("sleep", seconds=2):
+                    time.sleep(2)
                 self.logger.info("AgentEnv setup over!")
+                self._flush_timeline()
                 break
             except Exception as e:
                 self.logger.exception(f"Error setting up the agent env: {e}")
@@ -299,34 +450,55 @@ class AgentEnv:
         """
         Get the current state of the device
         """
+        with self.tracer.span("get_state", step=self.current_steps):
+            return self._get_state()
+
+    def _get_state(self) -> Dict[str, Any]:
         # save view hierarchy, screenshot, top activity name and agent action in local
         
         screenshot_dir_path, activity_dir_path, vh_dir_path, vh_json_dir_path = self._setup_directories(\
-                  self.task_output_path, ['screenshot', 'activity', 'xml', 'vh'])
+                  self.task_output_path, ['screenshot', 'activity', 'xml', 'vh'], archived=True)
 
         self.logger.info("getting the agent env state...")
         
-        view_hierarchy = self.device.get_viewhierachy()
-        view_hierarchy_json = xml_string_to_json(view_hierarchy)
-        activity_name = self.device.get_top_activity_name()
-        screenshot = self.device.get_screenshot()
+        with self.tracer.span("capture"):
+            captured, timings = self.state_capture.capture()
+        view_hierarchy = captured["view_hierarchy"]
+        activity_name = captured["activity_name"]
+        screenshot = captured["screenshot"]
+        convert_start = time.perf_counter()
+        with self.tracer.span("xml_string_to_json"):
+            view_hierarchy_json = xml_string_to_json(view_hierarchy)
+        timings["view_hierarchy_json"] = time.perf_counter() - convert_start
+        view_hierarchy_columnar = None
+        if self.columnar_vh:
+            convert_start = time.perf_counter()
+            with self.tracer.span("columnar_vh"):
+                view_hierarchy_columnar = ColumnarViewHierarchy.from_json(view_hierarchy_json)
+            timings["view_hierarchy_columnar"] = time.perf_counter() - convert_start
         
         tag = self.current_steps
+        timings["step"] = tag
+        self.step_timings.append(timings)
+        self.logger.info(f"state captured in {timings['capture_total']:.3f}s: {timings}")
         view_hierarchy_path = os.path.join(vh_dir_path, f"{tag}.xml")
         view_hierarchy_json_path = os.path.join(vh_json_dir_path, f"{tag}.vh")
         activity_path = os.path.join(activity_dir_path, f"{tag}.activity")
-        screenshot_path = os.path.join(screenshot_dir_path, f"{tag}.png")
-
-        with open(view_hierarchy_path, "w", encoding="utf-8") as vh_file:#.xml
-            vh_file.write(view_hierarchy)
-
-        with open(view_hierarchy_json_path, "w", encoding="utf-8") as vh_json_file:#.vh
-            json.dump(view_hierarchy_json, vh_json_file, ensure_ascii=False, indent=4)
-        
-        with open(activity_path, "w", encoding="utf-8") as activity_file:#.activity
-            activity_file.write(activity_name)
-        
-        screenshot.save(screenshot_path)#.png
+        screenshot_path = os.path.join(screenshot_dir_path, f"{tag}{self.screenshot_codec.extension}")
+
+        persist_start = time.perf_counter()
+        with self.tracer.span("persist"):
+            self.artifact_writer.write_text(view_hierarchy_path, view_hierarchy)#.xml
+            self.artifact_writer.write_view_hierarchy_json(view_hierarchy_json_path, view_hierarchy, view_hierarchy_json)#.vh
+            self.artifact_writer.write_text(activity_path, activity_name)#.activity
+            self.artifact_writer.save_image(screenshot_path, screenshot, timings)#.png / .webp / .jpg / .npy
+        timings["persist"] = time.perf_counter() - persist_start
+        if self.trace_index is not None:
+            with self.tracer.span("trace_index"):
+                self.trace_index.add_state(self.task_output_path, tag, activity_name, view_hierarchy, {
+                    "screenshot": screenshot_path, "xml": view_hierarchy_path,
+                    "vh": view_hierarchy_json_path, "activity": activity_path,
+                })
 
         self.logger.info(f"View hierarchy saved to: {view_hierarchy_path}")
         self.logger.info(f"Activity saved to {activity_path}")
@@ -353,10 +525,36 @@ class AgentEnv:
             # ]
             # 
         }
+        if view_hierarchy_columnar is not None:
+            # one in-memory form of the view hierarchy per state, the JSON one is still saved to view_hierarchy_json_path
+            del state["view_hierarchy_json"]
+            state["view_hierarchy_columnar"] = view_hierarchy_columnar # ColumnarViewHierarchy
 
         self.state_history.append(state)
         return state
     
+    def _episode_timings(self) -> Dict[str, float]:
+        """
+        Seconds spent in each get_state field and in waiting for the UI to settle over the whole episode.
+        """
+        timings = {}
+        for step_timings in self.step_timings:
+            for field, elapsed in step_timings.items():
+                if field != "step":
+                    timings[field] = timings.get(field, 0) + elapsed
+        timings["settle"] = sum(settle["latency"] for settle in self.settle_latencies)
+        return timings
+
+    def get_step_timings(self) -> list[dict[str, float]]:
+        """
+        Latency breakdown of every get_state call of the current episode, e.g.
+        {"step": 0, "view_hierarchy": 0.21, "activity_name": 0.05, "screenshot": 0.18, "capture_total": 0.22, "view_hierarchy_json": 0.03,
+        "persist": 0.002, "screenshot_encode": 0.15}
+        With async_persistence, screenshot_encode is filled in by the writer thread once the screenshot is written
+        (and is not part of persist).
+        """
+        return self.step_timings
+
     def get_state_history(self) -> list[dict[Any, str]]:
         self.logger.info("getting the agent env state_history...")
         return self.state_history
@@ -365,11 +563,21 @@ class AgentEnv:
         # action example
         # action_type: type, touch_point: [-1.0, -1.0], lift_point: [-1.0, -1.0], typed_text: ”best rated coffee maker”
         """Takes a step in the environment."""
+        with self.tracer.span("post_action", step=self.current_steps):
+            return self._post_action(action, do_execute=do_execute, action_dict=action_dict)
+
+    def _post_action(self, action: str, do_execute=False, action_dict: dict[Any, Any]=None) -> bool:
         operator_state = 0
+        action_target = None
+        step = self.current_steps # tag of the action file, current_steps is incremented once it is saved
         if not action.startswith('am') and not action.startswith('Oracle'):
             action_dict = parse_action_string(action)
             action_type, action_para = parse_action(action_dict)
             self.current_action = self._trans_action_format(action_type, action_para)
+            if self.annotate_actions and action_type in ("CLICK", "SWIPE"):
+                action_target = self._locate_action_target(action_para)
+                if action_target is not None and not action_target["valid"]:
+                    self.logger.warning(f"{action_type} at {action_target['point']} does not hit any clickable element")
             if do_execute:
                 operator_state = self._execute_action(action_type, action_para) 
         elif action.startswith('Oracle'):
@@ -388,11 +596,16 @@ class AgentEnv:
                 operator_state = self.device.adb_shell(action)
         if not ( self.current_action.startswith("am force-stop") and self.current_steps == 0 ):   
             # save the action
-            tag = self.current_steps
-            action_dir_path = self._setup_directories(self.task_output_path, ['action'])[0]
+            tag = step
+            action_dir_path = self._setup_directories(self.task_output_path, ['action'], archived=True)[0]
             action_path = os.path.join(action_dir_path, f"{tag}.action")
-            with open(action_path, "w") as action_file:
-                action_file.write(self.current_action)# n.action
+            self.artifact_writer.write_text(action_path, self.current_action)# n.action
+            if self.trace_index is not None:
+                with self.tracer.span("trace_index"):
+                    self.trace_index.add_action(self.task_output_path, tag, self.current_action, action_path)
+            if action_target is not None:
+                target_dir_path = self._setup_directories(self.task_output_path, ['action_target'], archived=True)[0]
+                self.artifact_writer.write_json(os.path.join(target_dir_path, f"{tag}.target"), action_target)# n.target
             
             self.logger.info("execute action: " + self.current_action)
             self.current_steps += 1
@@ -403,19 +616,19 @@ class AgentEnv:
             self.logger.info("episode end")
             # record installed packages after each episode
             self.ep_installed_apps = self.device.get_installed_apps()
-            ep_installed_dir = self._setup_directories(self.task_output_path, ['installed_apps'])[0]
+            ep_installed_dir = self._setup_directories(self.task_output_path, ['installed_apps'], archived=True)[0]
             self.ep_installed_fp = os.path.join(ep_installed_dir, "installed_apps.txt")
 
             if self.ep_installed_apps:
-                with open(self.ep_installed_fp, 'w') as file:
-                    for item in self.ep_installed_apps:
-                        file.write(f"{item}\n") # installed_apps.txt
+                self.artifact_writer.write_text(self.ep_installed_fp, "".join(f"{item}\n" for item in self.ep_installed_apps)) # installed_apps.txt
             else:
-                with open(self.ep_installed_fp, 'w') as file:
-                    file.write("")
+                self.artifact_writer.write_text(self.ep_installed_fp, "")
         if do_execute:
-            time.sleep(5) # original 5, i guess used to wait executing, modified; if disable executing, then no need to wait
-            self.logger.info("action executed successfully")
+            # wait until the UI settles instead of a fixed 5s; if disable executing, then no need to wait
+            with self.tracer.span("wait_for_settle"):
+                latency, stable = self.settle_detector.wait_for_settle()
+            self.settle_latencies.append({"step": step, "action_type": action_type, "latency": latency, "stable": stable})
+            self.logger.info(f"action executed successfully, UI {'settled' if stable else 'still changing'} after {latency:.2f}s")
         return operator_state
     
     def save_chat(self, conversation: str):
@@ -461,48 +674,136 @@ class AgentEnv:
 
     def get_instruction(self) -> str:
         try:
-            instruction, gr_path, app_short, episode, path = next(self.instruction_generator) # path here contains category(e.g. web_shopping) and episode, is a full path
+            while True:
+                current_instruction = self._next_instruction()
+                instruction, gr_path, app_short, episode, path = current_instruction # path here contains category(e.g. web_shopping) and episode, is a full path
+                if self.run_ledger is not None and self.run_ledger.is_completed(episode):
+                    self.logger.info(f"episode {episode} already completed, skipped")
+                    continue
+                break
+            self.current_instruction = current_instruction
             self.current_episode = episode
             self.task_output_path = path.replace("googleapps", "google_apps").replace("webshopping", "web_shopping") 
+            if self.run_ledger is not None:
+                if self.run_ledger.status(episode) == STARTED and os.path.exists(self.task_output_path):
+                    # interrupted while it was being written, start it over from scratch, keeping the partial output
+                    incomplete_path = os.path.join(f"{os.path.normpath(self.local_output_path)}.incomplete",
+                                                   os.path.relpath(self.task_output_path, self.local_output_path)
+                                                   + time.strftime(".%Y%m%d-%H%M%S"))
+                    self.logger.warning(f"episode {episode} was left incomplete, moving {self.task_output_path} to {incomplete_path}")
+                    os.makedirs(os.path.dirname(incomplete_path), exist_ok=True)
+                    shutil.move(self.task_output_path, incomplete_path)
+                self.run_ledger.mark_started(episode, self.task_output_path)
+            if self.trace_index is not None:
+                self.trace_index.remove_episode(self.task_output_path)
             return instruction, gr_path, app_short, episode, self.task_output_path
         except StopIteration:
             self.logger.warning("All instructions have been fetched.")  
             return None
   
     def reset_env(self):
+        with self.tracer.span("reset_env"):
+            self._reset_env()
+        self._flush_timeline()
+
+    def _reset_env(self):
         
         self.logger.info("resetting agent env...")
+        with self.tracer.span("flush_artifacts"):
+            self.artifact_writer.flush()
+        if self.run_ledger is not None and self.episode_end:
+            self.run_ledger.mark_completed(self.current_episode, self.current_steps, self._episode_timings())
+        if self.trace_index is not None and self.current_episode is not None:
+            self.trace_index.add_episode(self.task_output_path, self.max_steps)
+        self.current_instruction = None
         self.current_action = "None|None|None"
-        self.state_history = []
+        self.state_history = self._new_state_history()
+        self._target_index = (None, None)
+        self.settle_latencies = []
+        self.step_timings = []
         self.episode_end = False
         self.current_steps = 0
-        try:
-            self.device.disconnect()
-            time.sleep(5)
-            self.emulator_controller.reload_snapshot()
-            time.sleep(30)
-            self.device.connect()
-            time.sleep(5)
-            self.logger.info("agent env reset successfully!")
-        except Exception as e:
-            self.logger.exception(f"Error resetting agent env: {e}")
-            self.emulator_controller.reload_snapshot()
-            time.sleep(30)
-            self.device.connect()
+        for attempt in range(1, _RESET_ATTEMPTS + 1):
+            try:
+                self.device.disconnect()
+                with self.tracer.span("reload_snapshot", attempt=attempt):
+                    boot_latency = self.emulator_controller.reload_snapshot()
+                with self.tracer.span("_connect_device"):
+                    self._connect_device(boot_latency)
+                self.logger.info("agent env reset successfully!")
+                return
+            except Exception as e:
+                self.logger.exception(f"Error resetting agent env (attempt {attempt}/{_RESET_ATTEMPTS}): {e}")
+        # the emulator does not come back from its snapshot, start it over from scratch
+        self.logger.error(f"agent env not reset after {_RESET_ATTEMPTS} attempts, relaunching the emulator...")
+        with self.tracer.span("relaunch_emulator"):
+            try:
+                self.device.disconnect()
+            except Exception as e:
+                self.logger.error(f"Error disconnecting the device: {e}")
+            self.emulator_controller.exit_emulator()
+            self.emulator_controller.wait_for_exit()
+            self.set_up()
+        self.logger.info("agent env reset by relaunching the emulator")
 
     def episode_done(self) -> bool:
+        if self.episode_end:
+            # make sure the artifacts of the finished episode are on disk before it is handed back
+            self.artifact_writer.flush()
         return self.episode_end
     
     def tear_down(self) -> None:
+        self.state_capture.close()
+        self.artifact_writer.close()
+        if self.trace_index is not None:
+            self.trace_index.close()
         self.device.disconnect()
-        time.sleep(5)
+        with self.tracer.span("sleep", seconds=5):
+            time.sleep(5)
         self.emulator_controller.exit_emulator()
+        self._flush_timeline()
         self.logger.info(f"tear down the agent env...")
     
     def setup_task(self, instruction: str) -> None:
+        if isinstance(instruction, tuple):
+            # the (instruction, gr_path, app_short, episode, output_path) tuple of get_instruction
+            instruction = instruction[0]
         self.logger.info(f"setting up the task: {instruction}")
+        if self.device.u2d is None:
+            self.logger.info("no uiautomator2 device to set the task up on, skipped")
+            return
+        setup_class = get_task_setup_class(instruction)
+        if self.setup_snapshot_cache is None or setup_class is None:
+            TaskSetUp(self.device.u2d, instruction)
+            return
+
+        with self.tracer.span("setup_snapshot_cache"):
+            app_version = self.setup_snapshot_cache.app_version(self.device_serial, setup_class)
+            key = self.setup_snapshot_cache.key(self.emulator_controller.avd_name, setup_class, app_version)
+            snapshot_name = self.setup_snapshot_cache.lookup(self.device_serial, key)
+        if snapshot_name is not None:
+            try:
+                self.device.disconnect()
+                with self.tracer.span("reload_snapshot", snapshot=snapshot_name):
+                    if not self.emulator_controller.load_snapshot_in_place(snapshot_name):
+                        raise RuntimeError(f"snapshot {snapshot_name} could not be loaded")
+                    boot_latency = self.emulator_controller.wait_until_ready()
+                with self.tracer.span("_connect_device"):
+                    self._connect_device(boot_latency)
+                self.logger.info(f"task set up from snapshot {snapshot_name}")
+                return
+            except Exception as e:
+                self.logger.exception(f"Error restoring setup snapshot {snapshot_name}, running the setup: {e}")
+                self.setup_snapshot_cache.invalidate(key)
+                self._connect_device()
 
         TaskSetUp(self.device.u2d, instruction)
+        if self.emulator_controller.params.get("read-only") == "true":
+            # a read-only instance (EmulatorPool) can load snapshots but not save them
+            self.logger.info(f"read-only emulator, the setup of {setup_class.__name__} is not cached")
+            return
+        with self.tracer.span("save_setup_snapshot"):
+            self.setup_snapshot_cache.save(self.device_serial, key, instruction)
         
 
 
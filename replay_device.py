@@ -0,0 +1,170 @@
+import glob
+import logging
+import os
+import zlib
+from typing import Dict, List
+
+from device import BaseDevice
+from utils.readiness import ReadinessProbe
+from utils.screenshot_codec import SCREENSHOT_EXTENSIONS, decode_screenshot
+
+
+class ReplayDevice(BaseDevice):
+    """
+    In-process device replaying a trace recorded by AgentEnv, so the AgentEnv loop runs without an emulator.
+
+    The trace is the captured_data directory of an episode (or the episode directory holding it). Every
+    recorded step whose view hierarchy was saved is loaded once into memory: captured_data/xml/<n>.xml,
+    activity/<n>.activity and screenshot/<n>.png (or .webp, .jpg, .npy, see ScreenshotCodec). The device shows step 0 first, and each executed
+    action (click, swipe, text, keys, adb shell) moves it to the next step; the last step is shown
+    again once the trace is exhausted. With advance_on_capture, taking a screenshot moves it
+    forward instead, for loops that post actions without executing them.
+    """
+    def __init__(self, trace_path: str, device_serial: str = "replay-0", advance_on_capture: bool = False) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.serial = device_serial
+        self.u2d = None
+        self.advance_on_capture = advance_on_capture
+        captured_data_path = os.path.join(trace_path, "captured_data")
+        self.trace_path = captured_data_path if os.path.isdir(captured_data_path) else trace_path
+        self.steps = self._load_steps()
+        if not self.steps:
+            raise FileNotFoundError(f"no recorded step in {self.trace_path}")
+        self.width, self.height = self.steps[0]["screenshot"].size
+        self.installed_apps = self._load_installed_apps()
+        self.cursor = 0
+        self.actions = [] # (action, args) of every action received, in order
+        self.connected = False
+
+    def _read_text(self, path: str) -> str:
+        with open(path, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def _load_steps(self) -> List[Dict]:
+        steps = []
+        xml_paths = glob.glob(os.path.join(self.trace_path, "xml", "*.xml"))
+        for xml_path in sorted(xml_paths, key=lambda path: int(os.path.basename(path).split(".")[0])):
+            tag = os.path.basename(xml_path).split(".")[0]
+            activity_path = os.path.join(self.trace_path, "activity", f"{tag}.activity")
+            screenshot_paths = [os.path.join(self.trace_path, "screenshot", f"{tag}{extension}")
+                                for extension in SCREENSHOT_EXTENSIONS]
+            screenshot_path = next((path for path in screenshot_paths if os.path.exists(path)), None)
+            if screenshot_path is None:
+                self.logger.warning(f"step {tag} of {self.trace_path} has no screenshot, skipped")
+                continue
+            with open(screenshot_path, "rb") as file:
+                screenshot = decode_screenshot(file.read(), screenshot_path)
+            view_hierarchy = self._read_text(xml_path)
+            steps.append({
+                "view_hierarchy": view_hierarchy,
+                "fingerprint": zlib.crc32(view_hierarchy.encode("utf-8")),
+                "activity_name": self._read_text(activity_path) if os.path.exists(activity_path) else "",
+                "screenshot": screenshot,
+            })
+        return steps
+
+    def _load_installed_apps(self) -> List[str]:
+        installed_apps_path = os.path.join(self.trace_path, "installed_apps", "installed_apps.txt")
+        if not os.path.exists(installed_apps_path):
+            return []
+        return [app for app in self._read_text(installed_apps_path).split("\n") if app]
+
+    def _advance(self, action: str, *args) -> bool:
+        self.actions.append((action, args))
+        if not self.advance_on_capture:
+            self.cursor = min(self.cursor + 1, len(self.steps) - 1)
+        return True
+
+    def rewind(self) -> None:
+        """Go back to the first step of the trace, as an emulator snapshot reload would."""
+        self.cursor = 0
+        self.actions = []
+
+    def connect(self) -> None:
+        self.connected = True
+        self.logger.info(f"Replaying {len(self.steps)} steps from {self.trace_path}")
+
+    def disconnect(self) -> None:
+        self.connected = False
+
+    def ping(self) -> bool:
+        return self.connected
+
+    def get_viewhierachy(self) -> str:
+        return self.steps[self.cursor]["view_hierarchy"]
+
+    def get_ui_fingerprint(self) -> int:
+        return self.steps[self.cursor]["fingerprint"]
+
+    def get_screenshot(self):
+        screenshot = self.steps[self.cursor]["screenshot"]
+        if self.advance_on_capture:
+            self.cursor = min(self.cursor + 1, len(self.steps) - 1)
+        return screenshot
+
+    def get_screen_size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    def get_top_activity_name(self) -> str:
+        return self.steps[self.cursor]["activity_name"]
+
+    def get_installed_apps(self) -> List[str]:
+        return list(self.installed_apps)
+
+    def click(self, x: int, y: int):
+        return self._advance("click", x, y)
+
+    def swipe(self, x1: int, y1: int, x2: int, y2: int, duration=0.5):
+        return self._advance("swipe", x1, y1, x2, y2)
+
+    def input_text(self, text: str):
+        return self._advance("input_text", text)
+
+    def enter(self):
+        return self._advance("enter")
+
+    def home(self):
+        # AgentEnv presses home when it connects, that does not consume a step of the trace
+        self.actions.append(("home", ()))
+        return True
+
+    def back(self):
+        return self._advance("back")
+
+    def adb_shell(self, cmd: str):
+        self._advance("adb_shell", cmd)
+        return ""
+
+
+class ReplayEmulatorController:
+    """
+    Stand-in for EmulatorController when AgentEnv drives a ReplayDevice: there is no emulator to
+    launch, reloading the snapshot rewinds the trace and every readiness stage is immediate.
+    """
+    def __init__(self, device: ReplayDevice, readiness_deadlines: Dict[str, float] = None) -> None:
+        self.device = device
+        self.device_serial = device.serial
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.state = "off"
+        self.readiness_probe = ReadinessProbe(device.serial, deadlines=readiness_deadlines, poll_interval=0)
+        self.last_boot_latency = None
+        self.fast_reset = True
+
+    def load_emulator_with_snapshot(self, snapshot_name="default_boot") -> int:
+        self.state = "on"
+        return 0 # already running, nothing to wait for
+
+    def wait_until_ready(self) -> Dict[str, float]:
+        self.last_boot_latency = {"total": 0.0}
+        return self.last_boot_latency
+
+    def reload_snapshot(self, snapshot_name="default_boot") -> Dict[str, float]:
+        self.device.rewind()
+        self.state = "on"
+        return self.wait_until_ready()
+
+    def exit_emulator(self):
+        self.state = "off"
+
+    def wait_for_exit(self, timeout=20) -> bool:
+        return True
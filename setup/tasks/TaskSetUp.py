@@ -80,9 +80,13 @@ _TaskSetUpMap = {
     'Find and add the anime series \'Attack on Titan\' to my crunchylist \'weekly list\' on the Crunchyroll app.' : CrunchyrollTask01,
 }
 
+def get_task_setup_class(instruction):
+    """The BaseTaskSetup subclass preparing instruction, None if it needs no setup."""
+    return _TaskSetUpMap.get(instruction)
+
 def TaskSetUp(device, instruction):
     d = device #u2d
-    taskSetup= _TaskSetUpMap.get(instruction)
+    taskSetup= get_task_setup_class(instruction)
 
     if taskSetup:
         task = taskSetup(d, instruction)
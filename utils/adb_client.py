@@ -0,0 +1,282 @@
+import logging
+import os
+import socket
+import subprocess
+import threading
+from typing import Dict, List
+
+# seconds after which a run of the adb binary is killed when the caller gives no timeout
+_ADB_TIMEOUT = 30
+
+
+class AdbError(Exception):
+    def __init__(self, message="adb command failed", *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+class EmulatorConsole:
+    """
+    Long-lived connection to the console of one emulator, the telnet service `adb emu` talks to.
+
+    The connection is opened and authenticated (with ~/.emulator_console_auth_token) once, then
+    every command is a line written to the socket and a reply read up to its "OK" or "KO" line.
+    """
+    def __init__(self, port: int, host: str = "127.0.0.1", timeout: float = 10,
+                 auth_token_path: str = os.path.join(os.path.expanduser("~"), ".emulator_console_auth_token")) -> None:
+        self.port = port
+        self.host = host
+        self.timeout = timeout
+        self.auth_token_path = auth_token_path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _read_reply(self) -> str:
+        """
+        Read the lines of a reply up to its status line.
+
+        Raises:
+            AdbError: the console answered KO.
+        """
+        lines = []
+        while True:
+            line = self._reader.readline()
+            if not line:
+                raise ConnectionError(f"emulator console {self.port} closed the connection")
+            line = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            if line.startswith("OK"):
+                return "\n".join(lines)
+            if line.startswith("KO"):
+                raise AdbError(f"emulator console {self.port}: {line}")
+            lines.append(line)
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._reader = self._socket.makefile("rb")
+        banner = self._read_reply()
+        if "Authentication required" in banner:
+            with open(self.auth_token_path, "r") as file:
+                auth_token = file.read().strip()
+            self._socket.sendall(f"auth {auth_token}\n".encode("utf-8"))
+            self._read_reply()
+
+    def _is_stale(self) -> bool:
+        """True when the pooled connection was closed by the emulator (e.g. it was restarted) since the last command."""
+        try:
+            self._socket.setblocking(False)
+            try:
+                return self._socket.recv(1, socket.MSG_PEEK) == b""
+            finally:
+                self._socket.setblocking(True)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return True
+
+    def command(self, cmd: str, timeout: float = None, retry: bool = True) -> str:
+        """
+        Run a console command, e.g. "avd name" or "avd snapshot load default_boot".
+
+        The connection is reopened and the command sent again only when connecting or sending fails
+        (and retry is set): once the command is sent it is never repeated, a reply that does not come
+        within timeout is an error.
+
+        Returns:
+            str: The reply without its status line.
+
+        Raises:
+            AdbError: the console answered KO, or the reply timed out or was cut off.
+            OSError: the console can not be reached or the command could not be sent.
+        """
+        with self._lock:
+            attempts = 2 if retry else 1
+            for attempt in range(attempts):
+                try:
+                    if self._socket is not None and self._is_stale():
+                        self._close()
+                    if self._socket is None:
+                        self._connect()
+                    self._socket.settimeout(timeout or self.timeout)
+                    self._socket.sendall(f"{cmd}\n".encode("utf-8"))
+                    break
+                except (OSError, ConnectionError):
+                    self._close()
+                    if attempt == attempts - 1:
+                        raise
+                    self.logger.debug(f"emulator console {self.port} connection lost, reconnecting")
+            try:
+                return self._read_reply()
+            except socket.timeout:
+                self._close()
+                raise AdbError(f"emulator console {self.port}: no reply to {cmd!r} within {timeout or self.timeout}s")
+            except (OSError, ConnectionError) as e:
+                self._close()
+                raise AdbError(f"emulator console {self.port}: reply to {cmd!r} lost: {e}")
+
+    def _close(self) -> None:
+        if self._socket is not None:
+            try:
+                self._reader.close()
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket, self._reader = None, None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+
+class AdbClient:
+    """
+    adb commands without spawning the adb binary.
+
+    Device listing and shell commands speak the adb server protocol on its local socket (a hex length
+    prefixed request, then an OKAY or FAIL status); `emu` commands go through one persistent
+    EmulatorConsole per emulator. When the server or a console can not be reached, the adb binary is
+    run instead, as before (which also starts the adb server).
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 5037, socket_timeout: float = 10) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.host = host
+        self.port = port
+        self.socket_timeout = socket_timeout
+        self._consoles: Dict[str, EmulatorConsole] = {}
+        self._lock = threading.Lock()
+
+    def _run_adb(self, args: List[str], timeout: float = None) -> str:
+        """
+        Run the adb binary, killed after timeout seconds (_ADB_TIMEOUT when None).
+
+        Raises:
+            AdbError: adb exited with an error.
+            subprocess.TimeoutExpired: adb did not exit in time.
+        """
+        result = subprocess.run(["adb", *args], capture_output=True, text=True, timeout=timeout or _ADB_TIMEOUT)
+        if result.returncode != 0:
+            raise AdbError(f"adb {' '.join(args)} failed: {(result.stdout + result.stderr).strip()}")
+        return result.stdout
+
+    @staticmethod
+    def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("adb server closed the connection")
+            data += chunk
+        return data
+
+    def _request(self, sock: socket.socket, request: str) -> None:
+        """
+        Send a request to the adb server and check its status.
+
+        Raises:
+            AdbError: the server answered FAIL, e.g. for an unknown device.
+        """
+        payload = request.encode("utf-8")
+        sock.sendall(f"{len(payload):04x}".encode("ascii") + payload)
+        status = self._recv_exactly(sock, 4)
+        if status != b"OKAY":
+            length = int(self._recv_exactly(sock, 4), 16)
+            message = self._recv_exactly(sock, length).decode("utf-8", errors="replace")
+            raise AdbError(f"{request}: {message}")
+
+    def _connect(self, timeout: float = None) -> socket.socket:
+        return socket.create_connection((self.host, self.port), timeout=timeout or self.socket_timeout)
+
+    def devices(self) -> List[str]:
+        """Serials of all the devices known to the adb server, offline ones included (as `adb devices`)."""
+        try:
+            with self._connect() as sock:
+                self._request(sock, "host:devices")
+                length = int(self._recv_exactly(sock, 4), 16)
+                output = self._recv_exactly(sock, length).decode("utf-8")
+            return [line.split()[0] for line in output.splitlines() if line.strip()]
+        except OSError as e:
+            self.logger.debug(f"adb server unreachable ({e}), running adb devices")
+        output = self._run_adb(["devices"], timeout=10)
+        return [line.split()[0] for line in output.splitlines()
+                if line.strip() and not line.startswith("List of devices attached")]
+
+    def shell(self, serial: str, cmd: str, timeout: float = 10) -> str:
+        """
+        Output of `adb -s serial shell cmd`.
+
+        Raises:
+            AdbError: the device is unknown or the command could not be run.
+        """
+        try:
+            sock = self._connect(timeout)
+        except OSError as e:
+            self.logger.debug(f"adb server unreachable ({e}), running adb shell")
+            return self._run_adb(["-s", serial, "shell", cmd], timeout=timeout)
+        try:
+            with sock:
+                self._request(sock, f"host:transport:{serial}")
+                self._request(sock, f"shell:{cmd}")
+                chunks = []
+                while True:
+                    chunk = sock.recv(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+        except socket.timeout:
+            raise AdbError(f"adb shell {cmd!r} on {serial} timed out")
+        except OSError as e:
+            raise AdbError(f"adb shell {cmd!r} on {serial} failed: {e}")
+        return b"".join(chunks).decode("utf-8", errors="replace")
+
+    def console(self, serial: str) -> EmulatorConsole:
+        """The pooled console connection of the emulator serial ("emulator-<port>")."""
+        with self._lock:
+            console = self._consoles.get(serial)
+            if console is None:
+                console = self._consoles[serial] = EmulatorConsole(int(serial.split("-")[1]), host=self.host)
+            return console
+
+    def emu(self, serial: str, cmd: str, timeout: float = None, retry: bool = True) -> str:
+        """
+        Output of `adb -s serial emu cmd`, without the final OK line.
+
+        adb emu is only run when the command could not be sent to the console, never after it was
+        sent (a reply timeout is an error), so a command is not run twice. With retry=False the
+        command is tried once on the console, without reconnecting nor falling back to adb emu.
+
+        Raises:
+            AdbError: the console answered KO, did not reply in time, or could not be reached at all.
+        """
+        try:
+            return self.console(serial).command(cmd, timeout=timeout, retry=retry)
+        except (OSError, ConnectionError) as e:
+            if not retry:
+                raise AdbError(f"emulator console of {serial} unreachable: {e}")
+            self.logger.debug(f"emulator console of {serial} unreachable ({e}), running adb emu")
+        try:
+            output = self._run_adb(["-s", serial, "emu", *cmd.split()], timeout=timeout)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise AdbError(f"adb emu {cmd!r} on {serial} failed: {e}")
+        if "KO" in output:
+            raise AdbError(f"adb emu {cmd!r} on {serial} failed: {output.strip()}")
+        return "\n".join(line for line in output.strip().splitlines() if not line.startswith("OK"))
+
+    def close_console(self, serial: str) -> None:
+        """Drop the console connection of serial, e.g. once the emulator is killed."""
+        with self._lock:
+            console = self._consoles.pop(serial, None)
+        if console is not None:
+            console.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_adb_client() -> AdbClient:
+    """The AdbClient shared by the whole process, so its console connections are reused."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = AdbClient()
+        return _default_client
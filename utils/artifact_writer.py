@@ -0,0 +1,132 @@
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from utils.screenshot_codec import ScreenshotCodec
+from utils.tracing import Tracer
+from utils.transxml2vh import xml_string_to_json
+
+
+class ArtifactWriter:
+    """
+    Persist the artifacts captured by AgentEnv (view hierarchies, screenshots, actions...) to the filesystem.
+    """
+    def __init__(self, tracer: Tracer = None, screenshot_codec: ScreenshotCodec = None) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False) # spans around every write
+        self.screenshot_codec = screenshot_codec or ScreenshotCodec() # format, compression and size of the screenshots
+
+    def write_text(self, path: str, text: str) -> None:
+        with self.tracer.span("write_text", category="persist", path=path):
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(text)
+
+    def write_json(self, path: str, obj: Any) -> None:
+        with self.tracer.span("write_json", category="persist", path=path):
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(obj, file, ensure_ascii=False, indent=4)
+
+    def write_view_hierarchy_json(self, path: str, view_hierarchy: str, view_hierarchy_json: Any = None) -> None:
+        """
+        Write the JSON form (xml_string_to_json) of a view hierarchy XML: view_hierarchy_json when
+        the caller already converted it, else converted here.
+        """
+        if view_hierarchy_json is None:
+            view_hierarchy_json = xml_string_to_json(view_hierarchy)
+        self.write_json(path, view_hierarchy_json)
+
+    def save_image(self, path: str, image, timings: Dict[str, float] = None) -> None:
+        """
+        Encode and write a screenshot with screenshot_codec, whose extension path should have.
+        The seconds it took are stored as timings["screenshot_encode"].
+        """
+        with self.tracer.span("save_image", category="persist", path=path):
+            encode_start = time.perf_counter()
+            self.screenshot_codec.save(path, image)
+            if timings is not None:
+                timings["screenshot_encode"] = time.perf_counter() - encode_start
+
+    def flush(self) -> int:
+        """
+        Returns:
+            int: Number of writes that failed since the last flush, always 0 for synchronous writes.
+        """
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncArtifactWriter:
+    """
+    Write-behind wrapper of an ArtifactWriter: writes are queued and done by a background thread,
+    so PNG encoding and JSON dumping are off the agent's critical path.
+
+    The queue is bounded, when the writer falls behind by more than max_queue artifacts the caller
+    blocks until there is room again. flush() waits until everything queued so far is on disk.
+
+    What AgentEnv saves is also handed to the agent, which may change it before the background
+    thread writes it: images are copied before they are queued, and the view hierarchy JSON is
+    queued as its (immutable) XML string and converted in the background thread. Other JSON
+    objects, small ones such as action targets, are deep copied.
+    """
+    def __init__(self, sink: ArtifactWriter = None, max_queue: int = 64) -> None:
+        self.sink = sink or ArtifactWriter()
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._failed_writes = 0
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                write, args = task
+                write(*args)
+            except Exception as e:
+                self._failed_writes += 1
+                self.logger.exception(f"Error writing artifact {args[0]}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _submit(self, write: Callable[..., None], *args: Any) -> None:
+        self._queue.put((write, args)) # blocks while the queue is full
+
+    def write_text(self, path: str, text: str) -> None:
+        self._submit(self.sink.write_text, path, text)
+
+    def write_json(self, path: str, obj: Any) -> None:
+        self._submit(self.sink.write_json, path, copy.deepcopy(obj))
+
+    def write_view_hierarchy_json(self, path: str, view_hierarchy: str, view_hierarchy_json: Any = None) -> None:
+        # view_hierarchy_json may be changed by the agent before it is written, converted again in the background instead
+        self._submit(self.sink.write_view_hierarchy_json, path, view_hierarchy)
+
+    def save_image(self, path: str, image, timings: Dict[str, float] = None) -> None:
+        self._submit(self.sink.save_image, path, image.copy(), timings)
+
+    def flush(self) -> int:
+        """
+        Block until every queued artifact has been written.
+
+        Returns:
+            int: Number of writes that failed since the last flush.
+        """
+        self._queue.join()
+        failed_writes, self._failed_writes = self._failed_writes, 0
+        if failed_writes:
+            self.logger.error(f"{failed_writes} artifacts could not be written")
+        return failed_writes + self.sink.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self.sink.close()
@@ -0,0 +1,224 @@
+import sys
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from utils.transxml2vh import xml_string_to_json
+
+# bit of each boolean node attribute in ColumnarViewHierarchy.flags
+CHECKABLE = 1 << 0
+CHECKED = 1 << 1
+CLICKABLE = 1 << 2
+EDITABLE = 1 << 3
+ENABLED = 1 << 4
+FOCUSABLE = 1 << 5
+FOCUSED = 1 << 6
+IS_PASSWORD = 1 << 7
+LONG_CLICKABLE = 1 << 8
+SCROLLABLE = 1 << 9
+SELECTED = 1 << 10
+VISIBLE = 1 << 11
+
+_FLAG_FIELDS = (
+    ("checkable", CHECKABLE),
+    ("checked", CHECKED),
+    ("clickable", CLICKABLE),
+    ("editable", EDITABLE),
+    ("enabled", ENABLED),
+    ("focusable", FOCUSABLE),
+    ("focused", FOCUSED),
+    ("is_password", IS_PASSWORD),
+    ("long_clickable", LONG_CLICKABLE),
+    ("scrollable", SCROLLABLE),
+    ("selected", SELECTED),
+    ("visible", VISIBLE),
+)
+
+
+class _StringTable:
+    """Intern strings to int32 codes, None is encoded as -1."""
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        if value is None:
+            return -1
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+class ColumnarViewHierarchy:
+    """
+    Column oriented form of the view hierarchy returned by xml_string_to_json.
+
+    Node i of the JSON list is row i of every column:
+    - bounds: int32 (N, 4) array of x0, y0, x1, y1.
+    - flags: uint16 (N,) bitmask of the boolean attributes, see CLICKABLE, ENABLED...
+    - parent: int32 (N,) index of the parent node, -1 for the root.
+    - child_offsets, child_index: the children of node i are child_index[child_offsets[i]:child_offsets[i + 1]].
+    - class_ids, resource_id_ids, package_ids: int32 (N,) codes into class_table, resource_id_table and
+      package_table, -1 stands for None.
+    - text, content_description: plain lists of str or None.
+
+    Filters such as "all clickable nodes inside this rect" are then vectorized numpy expressions.
+    """
+    def __init__(self, bounds: np.ndarray, flags: np.ndarray, parent: np.ndarray, child_offsets: np.ndarray,
+                 child_index: np.ndarray, class_ids: np.ndarray, class_table: List[str], resource_id_ids: np.ndarray,
+                 resource_id_table: List[str], package_ids: np.ndarray, package_table: List[str],
+                 text: List[str], content_description: List[str]) -> None:
+        self.bounds = bounds
+        self.flags = flags
+        self.parent = parent
+        self.child_offsets = child_offsets
+        self.child_index = child_index
+        self.class_ids = class_ids
+        self.class_table = class_table
+        self.resource_id_ids = resource_id_ids
+        self.resource_id_table = resource_id_table
+        self.package_ids = package_ids
+        self.package_table = package_table
+        self.text = text
+        self.content_description = content_description
+
+    @classmethod
+    def from_json(cls, view_hierarchy_json: List[Dict[str, Any]]) -> "ColumnarViewHierarchy":
+        n_nodes = len(view_hierarchy_json)
+        bounds = np.empty((n_nodes, 4), dtype=np.int32)
+        flags = np.zeros(n_nodes, dtype=np.uint16)
+        parent = np.empty(n_nodes, dtype=np.int32)
+        child_offsets = np.zeros(n_nodes + 1, dtype=np.int32)
+        children = []
+        class_ids = np.empty(n_nodes, dtype=np.int32)
+        resource_id_ids = np.empty(n_nodes, dtype=np.int32)
+        package_ids = np.empty(n_nodes, dtype=np.int32)
+        classes, resource_ids, packages = _StringTable(), _StringTable(), _StringTable()
+        text, content_description = [], []
+
+        for i, node in enumerate(view_hierarchy_json):
+            (x0, y0), (x1, y1) = node["bounds"]
+            bounds[i] = (x0, y0, x1, y1)
+            node_flags = 0
+            for field, bit in _FLAG_FIELDS:
+                if node[field]:
+                    node_flags |= bit
+            flags[i] = node_flags
+            parent[i] = node["parent"]
+            children.extend(node["children"])
+            child_offsets[i + 1] = len(children)
+            class_ids[i] = classes.code(node["class"])
+            resource_id_ids[i] = resource_ids.code(node["resource_id"])
+            package_ids[i] = packages.code(node["package"])
+            text.append(node["text"])
+            content_description.append(node["content_description"])
+
+        return cls(bounds, flags, parent, child_offsets, np.array(children, dtype=np.int32),
+                   class_ids, classes.strings, resource_id_ids, resource_ids.strings,
+                   package_ids, packages.strings, text, content_description)
+
+    @classmethod
+    def from_xml(cls, xml_string: str) -> "ColumnarViewHierarchy":
+        return cls.from_json(xml_string_to_json(xml_string))
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes held by the view hierarchy: the numpy columns plus the string tables and text lists,
+        each list and each str it references counted with sys.getsizeof (None is not counted).
+        """
+        nbytes = sum(column.nbytes for column in (self.bounds, self.flags, self.parent, self.child_offsets,
+                                                  self.child_index, self.class_ids, self.resource_id_ids,
+                                                  self.package_ids))
+        for strings in (self.class_table, self.resource_id_table, self.package_table, self.text,
+                        self.content_description):
+            nbytes += sys.getsizeof(strings) + sum(sys.getsizeof(string) for string in strings if string is not None)
+        return nbytes
+
+    def children(self, i: int) -> np.ndarray:
+        return self.child_index[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def has_flags(self, mask: int) -> np.ndarray:
+        """Boolean (N,) array, True for the nodes having all the flags of mask set."""
+        return (self.flags & mask) == mask
+
+    def _codes_of(self, table: List[str], value: str) -> int:
+        if value is None:
+            return -1
+        try:
+            return table.index(value)
+        except ValueError:
+            return -2 # matches no node
+
+    def select(self, flags: int = 0, class_name: str = None, resource_id: str = None, package: str = None) -> np.ndarray:
+        """
+        Indices of the nodes having all the flags set and the given class, resource id and package.
+        Criteria left to None are not checked.
+        """
+        mask = self.has_flags(flags)
+        if class_name is not None:
+            mask &= self.class_ids == self._codes_of(self.class_table, class_name)
+        if resource_id is not None:
+            mask &= self.resource_id_ids == self._codes_of(self.resource_id_table, resource_id)
+        if package is not None:
+            mask &= self.package_ids == self._codes_of(self.package_table, package)
+        return np.flatnonzero(mask)
+
+    def nodes_in_rect(self, rect: Sequence[int], flags: int = 0, intersect: bool = False) -> np.ndarray:
+        """
+        Indices of the nodes lying inside rect, or intersecting it with intersect=True, and having all the flags set.
+
+        Args:
+            rect (Sequence[int]): (x0, y0, x1, y1) in pixels.
+        """
+        x0, y0, x1, y1 = rect
+        bounds = self.bounds
+        if intersect:
+            mask = (bounds[:, 0] < x1) & (bounds[:, 2] > x0) & (bounds[:, 1] < y1) & (bounds[:, 3] > y0)
+        else:
+            mask = (bounds[:, 0] >= x0) & (bounds[:, 2] <= x1) & (bounds[:, 1] >= y0) & (bounds[:, 3] <= y1)
+        if flags:
+            mask &= self.has_flags(flags)
+        return np.flatnonzero(mask)
+
+    def node(self, i: int) -> Dict[str, Any]:
+        """Node i in the format of xml_string_to_json."""
+        x0, y0, x1, y1 = self.bounds[i].tolist()
+        node_flags = int(self.flags[i])
+        class_id, resource_id_id = int(self.class_ids[i]), int(self.resource_id_ids[i])
+        package_id = int(self.package_ids[i])
+        children = self.children(i).tolist()
+        node = {
+            "bounds": [[x0, y0], [x1, y1]],
+            "checkable": bool(node_flags & CHECKABLE),
+            "checked": bool(node_flags & CHECKED),
+            "children": children,
+            "class": self.class_table[class_id] if class_id >= 0 else None,
+            "clickable": bool(node_flags & CLICKABLE),
+            "content_description": self.content_description[i],
+            "editable": bool(node_flags & EDITABLE),
+            "enabled": bool(node_flags & ENABLED),
+            "focusable": bool(node_flags & FOCUSABLE),
+            "focused": bool(node_flags & FOCUSED),
+            "is_password": bool(node_flags & IS_PASSWORD),
+            "long_clickable": bool(node_flags & LONG_CLICKABLE),
+            "package": self.package_table[package_id] if package_id >= 0 else None,
+            "parent": int(self.parent[i]),
+            "resource_id": self.resource_id_table[resource_id_id] if resource_id_id >= 0 else None,
+            "scrollable": bool(node_flags & SCROLLABLE),
+            "selected": bool(node_flags & SELECTED),
+            "size": "1080*2400",
+            "temp_id": i,
+            "text": self.text[i],
+            "visible": bool(node_flags & VISIBLE),
+            "child_count": len(children),
+        }
+        return node
+
+    def to_json(self) -> List[Dict[str, Any]]:
+        return [self.node(i) for i in range(len(self))]
@@ -1,14 +1,30 @@
 import subprocess
 import logging
+import os
 import time
+from typing import Dict
+
+from utils.adb_client import AdbError, get_adb_client
+from utils.emulator_log import EmulatorLogWatcher
+from utils.readiness import ReadinessProbe, ReadinessTimeout
+
+# emulator options that are passed as bare flags when their value is "true"
+_FLAG_PARAMS = ("no-window", "read-only")
 
 class EmulatorController:
-    def __init__(self,avd_name,device_serial,params):
+    def __init__(self,avd_name,device_serial,params,readiness_deadlines=None,fast_reset=False,log_patterns=None):
         self.avd_name = avd_name
         self.device_serial = device_serial
         self.params = params
         self.logger = logging.getLogger(self.__class__.__name__)
         self.state = "off" # off or on， the state of the emulator
+        self.readiness_probe = ReadinessProbe(device_serial, deadlines=readiness_deadlines)
+        self.last_boot_latency = None # latency of each readiness stage of the last (re)load
+        self.fast_reset = fast_reset # reload snapshots in place through the emulator console instead of relaunching
+        self.adb = get_adb_client() # adb server socket and emulator console connections, shared by the process
+        self.log_patterns = log_patterns # {"success": [regex], "failure": [regex]} of the emulator output, see EmulatorLogWatcher
+        self.log_watcher = None
+        self.process = None # Popen of the emulator launched by load_emulator_with_snapshot
 
     def load_emulator_with_snapshot(self, snapshot_name="default_boot") -> int:
         """
@@ -21,7 +37,8 @@ class EmulatorController:
             # Check if the emulator is already running
             devices = self.get_adb_devices()
             for device in devices:
-                if not device.startswith("emulator"):
+                # several instances of the same AVD may run side by side (EmulatorPool), only ours counts
+                if device != self.device_serial:
                     continue
                 avd_name = self.get_avd_name_from_device(device)
                 if avd_name:
@@ -33,7 +50,7 @@ class EmulatorController:
             # Build the command to start the emulator
             cmd = ["emulator", "-avd", self.avd_name, "-port", self.device_serial.split("-")[1] , "-snapshot", snapshot_name, "-no-snapshot-save", "-feature", "-Vulkan"]
             for key, value in self.params.items():
-                if key == "no-window":
+                if key in _FLAG_PARAMS:
                     if value == "true":
                         cmd.append(f"-{key}")
                 else:
@@ -45,55 +62,31 @@ class EmulatorController:
             
             self.logger.info(f"Loading emulator '{self.avd_name}' with snapshot '{snapshot_name}'.")
             port_num = self.device_serial.split("-")[1]
-            with open(f"log/emulator_{port_num}.log", "w+") as log_file_handle:
-                process = subprocess.Popen(
-                    cmd,
-                    stdout=log_file_handle,
-                    stderr=subprocess.STDOUT,
-                    universal_newlines=True,
-                )
-
-                # 启动日志监控
-                if self.monitor_log_for_string(log_file_handle, "Failed to load snapshot 'default_boot'"):
-                    self.logger.error("Snapshot default_boot can't be loaded, terminate emulator...")
-                    self.exit_emulator()  # 终止子进程
-                    return -1
-                else:                   
-                    self.state = "on"
-                    return 1
+            os.makedirs("log", exist_ok=True)
+            process = self.process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=True,
+                errors="replace",
+            )
+
+            # 启动日志监控: the output is teed to log/emulator_<port>.log and matched line by line
+            self.log_watcher = EmulatorLogWatcher(process, f"log/emulator_{port_num}.log", snapshot_name=snapshot_name,
+                                                  patterns=self.log_patterns)
+            if self.log_watcher.wait(timeout=30) is False:
+                self.logger.error(f"Snapshot {snapshot_name} can't be loaded, terminate emulator...")
+                self.kill_process()  # 终止子进程
+                return -1
+            else:
+                # a success pattern matched, or nothing decisive was printed in time: go on as before
+                self.state = "on"
+                return 1
         except Exception as e:
-            self.exit_emulator()  # 终止子进程
+            self.kill_process()  # 终止子进程
             self.logger.exception(f"Error loading emulator with snapshot: {e}")
             return -1
 
-    def monitor_log_for_string(self, log_file_handle, target_string):
-        """
-        监控日志文件是否包含目标字符串。
-
-        Args:
-            log_file (str): 日志文件路径。
-            target_string (str): 要查找的目标字符串。
-        """
-        try:
-            # 移动到文件末尾
-            import os
-            log_file_handle.seek(0, os.SEEK_END)
-            start_time = time.time()
-            timeout = 30  # 30秒
-            lineCount = 0
-            while not (time.time() - start_time > timeout and lineCount > 35):
-                line = log_file_handle.readline()
-                if line:
-                    if target_string in line:
-                        self.logger.error(f"检测到目标字符串: {target_string}")
-                        return True  # 检测到目标字符串
-                else:
-                    lineCount += 1
-                    time.sleep(0.2)  # 等待文件更新
-        except KeyboardInterrupt:
-             self.logger.warning("监控被中断")
-        return False
-
     def get_adb_devices(self):
         """
         Get the list of connected devices using adb devices.
@@ -102,9 +95,7 @@ class EmulatorController:
         list: A list of connected device IDs.
         """
         try:
-            output = subprocess.check_output(["adb", "devices"]).decode("utf-8")
-            devices = [line.split()[0] for line in output.splitlines() if line.strip() and not line.startswith("List of devices attached")]
-            return devices
+            return self.adb.devices()
         except Exception as e:
             self.logger.error(f"Error getting adb devices: {e}")
             return []
@@ -120,9 +111,9 @@ class EmulatorController:
         str: The AVD name or None if not found.
         """
         try:
-            output = subprocess.check_output(["adb", "-s", device_id, "emu", "avd", "name"]).decode("utf-8")
+            output = self.adb.emu(device_id, "avd name")
             # Extract the AVD name from the output
-            avd_name = output.strip().split('\r\n')[0]
+            avd_name = output.strip().splitlines()[0]
             return avd_name
         except Exception as e:
             self.logger.error(f"Error getting AVD name for device {device_id}: {e}")
@@ -161,28 +152,107 @@ class EmulatorController:
         """
         try:
             self.logger.info(f"Exiting emulator '{self.avd_name}'.")
-            subprocess.run(["adb", "-s", f"{self.device_serial}", "emu", "kill"], check=True)
+            self.adb.emu(self.device_serial, "kill")
             self.state = "off"
         except Exception as e:
             self.logger.error(f"Error exiting emulator: {e}")
+        finally:
+            self.adb.close_console(self.device_serial)
+
+    def kill_process(self, timeout=10):
+        """
+        Kill the emulator process this controller launched, e.g. after a failed launch whose console
+        may not answer; falls back to exit_emulator when no process was launched here.
+        """
+        process, self.process = self.process, None
+        if process is None:
+            self.exit_emulator()
+            return
+        self.logger.info(f"Killing emulator process {process.pid} of '{self.avd_name}'.")
+        try:
+            process.kill()
+            process.wait(timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            self.logger.error(f"Error killing emulator process {process.pid}: {e}")
+        finally:
+            self.state = "off"
+            self.adb.close_console(self.device_serial)
+
+    def load_snapshot_in_place(self, snapshot_name="default_boot") -> bool:
+        """
+        Restore a snapshot in the running emulator through its console, without killing the process.
+
+        Args:
+        snapshot_name (str): the name of snapshot.
+
+        Returns:
+        bool: True if the console acknowledged the load.
+        """
+        try:
+            self.logger.info(f"Loading snapshot '{snapshot_name}' in place on '{self.device_serial}'.")
+            self.adb.emu(self.device_serial, f"avd snapshot load {snapshot_name}", timeout=120)
+            return True
+        except AdbError as e:
+            self.logger.error(f"Console failed to load snapshot '{snapshot_name}': {e}")
+            return False
+        except Exception as e:
+            self.logger.error(f"Error loading snapshot '{snapshot_name}' in place: {e}")
+            return False
+
+    def wait_for_exit(self, timeout=20) -> bool:
+        """
+        Wait until the emulator has left the adb device list, so that its port can be reused.
+
+        Returns:
+        bool: True if the emulator is gone before the timeout.
+        """
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            if self.device_serial not in self.get_adb_devices():
+                return True
+            time.sleep(0.5)
+        self.logger.warning(f"Emulator '{self.device_serial}' still listed after {timeout}s.")
+        return False
+
+    def wait_until_ready(self) -> Dict[str, float]:
+        """
+        Wait until the freshly loaded emulator has booted and its package manager answers.
 
-    def reload_snapshot(self, snapshot_name="default_boot"):
+        Returns:
+        dict: latency of each readiness stage in seconds, see ReadinessProbe.wait_for_emulator.
+        """
+        self.last_boot_latency = self.readiness_probe.wait_for_emulator()
+        self.logger.info(f"Emulator '{self.device_serial}' ready in {self.last_boot_latency['total']:.2f}s: {self.last_boot_latency}")
+        return self.last_boot_latency
+
+    def reload_snapshot(self, snapshot_name="default_boot") -> Dict[str, float]:
         """
         reload the specified snapshot.
 
         Args:
         snapshot_name (str): the name of snapshot。
+
+        Returns:
+        dict: latency of each readiness stage of the reload, None if the emulator was already running.
         """
+        if self.fast_reset and self.state == "on":
+            if self.load_snapshot_in_place(snapshot_name):
+                try:
+                    return self.wait_until_ready()
+                except ReadinessTimeout as e:
+                    self.logger.error(f"Emulator not ready after in-place snapshot load: {e}")
+            self.logger.warning("In-place snapshot load failed, relaunching the emulator...")
         if self.state == "on":
             # first exit the emulator
             self.exit_emulator()
-            time.sleep(20)
+            self.wait_for_exit()
             # restart the emulator with the specified snapshot
-        is_new_load=self.load_emulator_with_snapshot()
+        is_new_load=self.load_emulator_with_snapshot(snapshot_name)
         while is_new_load<0:
             self.logger.info("loading emulator failed, retrying...")
-            is_new_load=self.load_emulator_with_snapshot()
+            is_new_load=self.load_emulator_with_snapshot(snapshot_name)
             time.sleep(10)
         if is_new_load==1:
             self.logger.info("emulator loaded successfully!")
-            time.sleep(30) # waiting for emulator to start
+            return self.wait_until_ready()
+        return None
@@ -0,0 +1,87 @@
+import logging
+import re
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+# regexes searched in the emulator output, "{snapshot}" is replaced by the (escaped) snapshot name;
+# FATAL and PANIC only count as the log level of the line ("FATAL   | ...", "PANIC: ..."), not
+# anywhere in a message, e.g. a kernel line mentioning a non-fatal panic
+DEFAULT_LOG_PATTERNS = {
+    "success": [
+        r"Successfully loaded snapshot '{snapshot}'",
+        r"[Bb]oot completed",
+    ],
+    "failure": [
+        r"Failed to load snapshot '{snapshot}'",
+        r"^\s*(?:emulator: )?FATAL\s*(?:\||:)",
+        r"^\s*(?:emulator: )?PANIC\s*(?:\||:)",
+    ],
+}
+
+
+class EmulatorLogWatcher:
+    """
+    Follow the output of an emulator process through its stdout pipe.
+
+    A background thread copies every line to the log file and checks it against the success and
+    failure patterns as soon as it is written; the first match decides the outcome of the launch.
+    The thread keeps draining the pipe (and filling the log) for the whole life of the emulator
+    so the process never blocks on a full pipe.
+    """
+    def __init__(self, process: subprocess.Popen, log_path: str, snapshot_name: str = "default_boot",
+                 patterns: Dict[str, List[str]] = None) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.process = process
+        self.log_path = log_path
+        patterns = patterns or DEFAULT_LOG_PATTERNS
+        snapshot = re.escape(snapshot_name)
+        self.success_patterns = [re.compile(pattern.replace("{snapshot}", snapshot)) for pattern in patterns.get("success", [])]
+        self.failure_patterns = [re.compile(pattern.replace("{snapshot}", snapshot)) for pattern in patterns.get("failure", [])]
+        self.outcome = None # True / False once a success / failure pattern matched or the process exited
+        self.matched_line = None
+        self._decided = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=self.__class__.__name__, daemon=True)
+        self._thread.start()
+
+    def _decide(self, outcome: bool, line: str) -> None:
+        if not self._decided.is_set():
+            self.outcome = outcome
+            self.matched_line = line
+            self._decided.set()
+
+    def _check(self, line: str) -> None:
+        for pattern in self.failure_patterns:
+            if pattern.search(line):
+                self._decide(False, line)
+                return
+        for pattern in self.success_patterns:
+            if pattern.search(line):
+                self._decide(True, line)
+                return
+
+    def _run(self) -> None:
+        with open(self.log_path, "w", encoding="utf-8") as log_file:
+            for line in self.process.stdout:
+                log_file.write(line)
+                log_file.flush()
+                if not self._decided.is_set():
+                    self._check(line)
+        # end of the output: the emulator exited before anything decisive was printed
+        self._decide(False, f"emulator exited with code {self.process.wait()}")
+
+    def wait(self, timeout: float = 30) -> Optional[bool]:
+        """
+        Block until the launch is decided.
+
+        Returns:
+            bool: True if a success pattern matched first, False if a failure pattern matched or the
+            emulator exited, None if nothing decisive appeared within timeout seconds.
+        """
+        if not self._decided.wait(timeout):
+            return None
+        if self.outcome:
+            self.logger.info(f"emulator launch succeeded: {self.matched_line.strip()}")
+        else:
+            self.logger.error(f"emulator launch failed: {self.matched_line.strip()}")
+        return self.outcome
@@ -0,0 +1,170 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from environment import AgentEnv, generate_instructions
+from utils.episode_scheduler import load_max_steps, schedule_instructions
+
+# adb only auto-discovers emulators whose console port lies in 5554..5584
+_MAX_AUTO_DISCOVERED_EMULATORS = 16
+
+
+class EmulatorLease:
+    """
+    Exclusive right of one worker to use one emulator instance of an EmulatorPool.
+
+    Attributes:
+        index (int): Position of the emulator inside the pool.
+        port (int): Console port of the emulator, the adb serial is `emulator-<port>`.
+        emulator_controller_args (dict): Emulator arguments of this instance, ready to be passed to AgentEnv.
+    """
+    def __init__(self, pool: "EmulatorPool", index: int, port: int, emulator_controller_args: Dict[str, str]) -> None:
+        self.pool = pool
+        self.index = index
+        self.port = port
+        self.device_serial = f"emulator-{port}"
+        self.emulator_controller_args = emulator_controller_args
+
+    def release(self) -> None:
+        self.pool.release(self)
+
+    def __enter__(self) -> "EmulatorLease":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
+
+
+class EmulatorPool:
+    """
+    A pool of N instances of the same AVD, each one listening on its own console port.
+
+    Every instance is run with `-read-only` so that the same AVD can be launched several times,
+    workers lease an instance, build their own AgentEnv on it and all take instructions from one
+    shared queue, so a fast worker simply steals the episodes a slow one has not started yet.
+    """
+    def __init__(self, avd_name: str, size: int, emulator_controller_args: Dict[str, str], base_port: int = 5554) -> None:
+        self.avd_name = avd_name
+        self.size = size
+        self.logger = logging.getLogger(self.__class__.__name__)
+        if size > _MAX_AUTO_DISCOVERED_EMULATORS:
+            self.logger.warning(f"adb only discovers {_MAX_AUTO_DISCOVERED_EMULATORS} emulators automatically, "
+                                f"instances above that need `adb connect`.")
+
+        self.failed_instructions = [] # instructions of the last run given up after max_attempts, see run
+        self._free_leases = queue.Queue()
+        for index in range(size):
+            port = int(base_port) + 2 * index # every emulator uses the console port and the next one for adb
+            args = dict(emulator_controller_args)
+            args["port"] = str(port)
+            if size > 1:
+                args["read-only"] = "true"
+            self._free_leases.put(EmulatorLease(self, index, port, args))
+
+    def acquire(self, timeout: float = None) -> EmulatorLease:
+        """
+        Take a free emulator instance, blocking until one is released.
+        """
+        return self._free_leases.get(timeout=timeout)
+
+    def release(self, lease: EmulatorLease) -> None:
+        self._free_leases.put(lease)
+
+    def create_env(self, lease: EmulatorLease, **env_kwargs: Any) -> AgentEnv:
+        """
+        Build an AgentEnv bound to the emulator instance of the lease.
+        """
+        return AgentEnv(
+            avd_name=self.avd_name,
+            emulator_controller_args=lease.emulator_controller_args,
+            **env_kwargs,
+        )
+
+    @staticmethod
+    def build_instruction_queue(instruction_fp: str, local_output_path: str, schedule_episodes: bool = False,
+                                max_step_fp: str = "max_step.json") -> queue.Queue:
+        """
+        Load every instruction of instruction_fp into a queue shared by all the workers,
+        in schedule order with schedule_episodes (see schedule_instructions).
+        """
+        instructions = pd.read_csv(instruction_fp, sep='\t')
+        if schedule_episodes:
+            instructions = schedule_instructions(instructions, load_max_steps(max_step_fp))
+        instruction_queue = queue.Queue()
+        for instruction in generate_instructions(instructions, local_output_path):
+            instruction_queue.put(instruction)
+        return instruction_queue
+
+    def run(self, worker_fn: Callable[[AgentEnv], Any], instruction_fp: str, local_output_path: str = "exec_output",
+            max_attempts: int = 2, **env_kwargs: Any) -> List[Any]:
+        """
+        Run worker_fn on one AgentEnv per emulator instance in parallel until the instructions run out.
+
+        When worker_fn raises, the instruction it was running is put back in the queue (up to
+        max_attempts runs in all, then it is recorded in failed_instructions), the AgentEnv is reset
+        and worker_fn is called again on the same lease.
+
+        Args:
+            worker_fn (Callable): Drives an already set up AgentEnv, typically the
+                `get_instruction` / `get_state` / `post_action` loop of MockAgent2AgentEnv.py.
+            instruction_fp (str): The TSV file with the instructions to run.
+            local_output_path (str): Directory where the captured data is stored.
+            max_attempts (int): Number of times an instruction is run before it is given up.
+
+        Returns:
+            list: The return value of worker_fn for each instance, None for a worker that failed.
+        """
+        instruction_queue = self.build_instruction_queue(instruction_fp, local_output_path,
+                                                         schedule_episodes=env_kwargs.get("schedule_episodes", False),
+                                                         max_step_fp=env_kwargs.get("max_step_fp", "max_step.json"))
+        self.logger.info(f"running {instruction_queue.qsize()} instructions on {self.size} emulators")
+        results = [None] * self.size
+        self.failed_instructions = []
+        attempts = {}
+        attempts_lock = threading.Lock()
+
+        def requeue(instruction: tuple) -> None:
+            with attempts_lock:
+                attempts[instruction] = attempts.get(instruction, 0) + 1
+                if attempts[instruction] < max_attempts:
+                    instruction_queue.put(instruction)
+                    self.logger.warning(f"episode {instruction[3]} requeued (attempt {attempts[instruction]} failed)")
+                else:
+                    self.failed_instructions.append(instruction)
+                    self.logger.error(f"episode {instruction[3]} failed {attempts[instruction]} times, given up")
+
+        def worker(slot: int) -> None:
+            with self.acquire() as lease:
+                agent_env = self.create_env(lease, local_output_path=local_output_path, instruction_fp=instruction_fp,
+                                            instruction_queue=instruction_queue, **env_kwargs)
+                try:
+                    agent_env.set_up()
+                    while True:
+                        try:
+                            results[slot] = worker_fn(agent_env)
+                            break
+                        except Exception as e:
+                            self.logger.exception(f"Worker on {lease.device_serial} failed on episode "
+                                                  f"{agent_env.current_episode}: {e}")
+                            instruction = agent_env.current_instruction
+                            try:
+                                agent_env.reset_env()
+                            except Exception as reset_error:
+                                self.logger.exception(f"Reset of {lease.device_serial} failed, setting it up again: {reset_error}")
+                                agent_env.set_up()
+                            if instruction is not None:
+                                requeue(instruction)
+                except Exception as e:
+                    self.logger.exception(f"Worker on {lease.device_serial} failed: {e}")
+                finally:
+                    agent_env.tear_down()
+
+        threads = [threading.Thread(target=worker, args=(slot,), name=f"EmulatorPool-{slot}") for slot in range(self.size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
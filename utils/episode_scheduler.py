@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+from typing import Dict
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def load_max_steps(max_step_fp: str = "max_step.json") -> Dict[str, int]:
+    """
+    Load the {episode: number of steps of the recorded trace} written by PrepareApps.extract_max_step_to_json,
+    an empty dict if the file does not exist.
+    """
+    if not os.path.exists(max_step_fp):
+        logger.warning(f"{max_step_fp} not found, falling back to the nsteps column")
+        return {}
+    with open(max_step_fp, "r") as file:
+        return {str(episode): int(steps) for episode, steps in json.load(file).items()}
+
+
+def expected_steps(instructions: pd.DataFrame, max_steps: Dict[str, int] = None) -> pd.Series:
+    """
+    Expected length of each episode: its max_step.json entry, else its nsteps column, else 0.
+    """
+    max_steps = max_steps or {}
+    nsteps = instructions["nsteps"] if "nsteps" in instructions else pd.Series(0, index=instructions.index)
+    from_max_steps = instructions["episode"].astype(str).map(max_steps)
+    return from_max_steps.fillna(nsteps).fillna(0).astype(int)
+
+
+def schedule_instructions(instructions: pd.DataFrame, max_steps: Dict[str, int] = None) -> pd.DataFrame:
+    """
+    Reorder the instruction table so that the episodes of an app run back to back, long episodes first.
+
+    Episodes are grouped by (app, login_category): the episodes of a group drive the same app from
+    the same login state, with the same setup (and setup snapshot, see SetupSnapshotCache), so they
+    run one after the other while the app's files are still in the page cache. Within a group the
+    episodes come longest first, and groups are ordered by their longest episode, longest first: a
+    group only follows groups whose episodes can all be as long, so the end of the run is made of
+    short episodes only, which even out the finishing times of the workers of an EmulatorPool
+    (they take the next instruction as soon as they are free). Every episode still starts from
+    the default_boot snapshot, the order saves no reset.
+
+    Args:
+        instructions (DataFrame): The instruction table (episode, category, path, description, nsteps, app, login_category).
+        max_steps (dict): {episode: steps} of the recorded traces, see load_max_steps.
+
+    Returns:
+        DataFrame: The same rows in schedule order.
+    """
+    if instructions.empty:
+        return instructions
+    keys = pd.DataFrame({
+        "app": instructions["app"].fillna("").astype(str).str.strip() if "app" in instructions else "",
+        "login_category": (instructions["login_category"].fillna("").astype(str).str.strip()
+                           if "login_category" in instructions else ""),
+        "steps": expected_steps(instructions, max_steps),
+    }, index=instructions.index)
+    keys["group_max_steps"] = keys.groupby(["app", "login_category"])["steps"].transform("max")
+    # the stable sort keeps the file order among equal keys
+    order = keys.sort_values(["group_max_steps", "app", "login_category", "steps"],
+                             ascending=[False, True, True, False], kind="mergesort").index
+    scheduled = instructions.loc[order]
+    logger.info(f"scheduled {len(scheduled)} episodes in {keys.groupby(['app', 'login_category']).ngroups} app groups")
+    return scheduled
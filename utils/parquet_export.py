@@ -0,0 +1,181 @@
+import argparse
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterable, List
+
+from utils.columnar_vh import ColumnarViewHierarchy
+from utils.parse_action import parse_action_record
+from utils.trace_archive import EpisodeArtifacts, iter_episode_dirs
+from utils.trace_index import episode_key
+
+logger = logging.getLogger(__name__)
+
+
+def _import_pyarrow():
+    """pyarrow is only needed to export and load trajectories, it is imported on first use."""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("the Parquet export needs pyarrow, install it with `pip install pyarrow`") from e
+    return pyarrow, pyarrow.parquet
+
+
+def trajectory_schema(screenshot_bytes: bool = False):
+    """
+    Schema of the trajectory rows, one per step.
+
+    The view hierarchy is stored in the columns of ColumnarViewHierarchy, one list per step: vh_bounds
+    holds x0, y0, x1, y1 of every node one after the other, vh_flags the bitmasks of utils.columnar_vh,
+    vh_parent the parent indices (-1 for the root); strings are dictionary encoded. run is the
+    absolute path of the captured_data tree the episode was recorded in, so that the same episode
+    recorded by several runs can be told apart.
+    """
+    pa, _ = _import_pyarrow()
+    dictionary_string = pa.dictionary(pa.int32(), pa.string())
+    fields = [
+        pa.field("run", dictionary_string),
+        pa.field("episode", pa.string()),
+        pa.field("step", pa.int32()),
+        pa.field("action_type", dictionary_string),
+        pa.field("touch_x", pa.float32()),
+        pa.field("touch_y", pa.float32()),
+        pa.field("lift_x", pa.float32()),
+        pa.field("lift_y", pa.float32()),
+        pa.field("typed_text", pa.string()),
+        pa.field("activity", dictionary_string),
+        pa.field("screenshot_path", pa.string()),
+        pa.field("vh_bounds", pa.list_(pa.int32())),
+        pa.field("vh_flags", pa.list_(pa.uint16())),
+        pa.field("vh_parent", pa.list_(pa.int32())),
+        pa.field("vh_class", pa.list_(dictionary_string)),
+        pa.field("vh_resource_id", pa.list_(dictionary_string)),
+        pa.field("vh_package", pa.list_(dictionary_string)),
+        pa.field("vh_text", pa.list_(pa.string())),
+        pa.field("vh_content_description", pa.list_(pa.string())),
+    ]
+    if screenshot_bytes:
+        fields.append(pa.field("screenshot", pa.binary()))
+    return pa.schema(fields)
+
+
+def _decode(ids, table: List[str]) -> List[str]:
+    return [table[i] if i >= 0 else None for i in ids.tolist()]
+
+
+def episode_rows(episode_dir: str, screenshot_bytes: bool = False) -> Dict[str, List[Any]]:
+    """
+    The steps of a recorded episode as columns of trajectory_schema.
+    Steps without view hierarchy (e.g. only an action) have empty view hierarchy lists.
+    """
+    _, run, _, episode = episode_key(episode_dir)
+    columns: Dict[str, List[Any]] = {name: [] for name in trajectory_schema(screenshot_bytes).names}
+    with EpisodeArtifacts(episode_dir) as artifacts:
+        for step, paths in sorted(artifacts.steps.items()):
+            columns["run"].append(run)
+            columns["episode"].append(episode)
+            columns["step"].append(step)
+            record = parse_action_record(artifacts.read_text(paths["action"])) if "action" in paths else None
+            touch_x, touch_y = (record.touch_point if record is not None and record.touch_point else (None, None))
+            lift_x, lift_y = (record.lift_point if record is not None and record.lift_point else (None, None))
+            columns["action_type"].append(record.action_type if record is not None else None)
+            columns["touch_x"].append(touch_x)
+            columns["touch_y"].append(touch_y)
+            columns["lift_x"].append(lift_x)
+            columns["lift_y"].append(lift_y)
+            columns["typed_text"].append(record.typed_text if record is not None else None)
+            columns["activity"].append(artifacts.read_text(paths["activity"]).strip() if "activity" in paths else None)
+            columns["screenshot_path"].append(paths.get("screenshot"))
+            if screenshot_bytes:
+                columns["screenshot"].append(artifacts.read(paths["screenshot"]) if "screenshot" in paths else None)
+            if "vh" in paths:
+                vh = ColumnarViewHierarchy.from_json(json.loads(artifacts.read(paths["vh"])))
+                columns["vh_bounds"].append(vh.bounds.ravel())
+                columns["vh_flags"].append(vh.flags)
+                columns["vh_parent"].append(vh.parent)
+                columns["vh_class"].append(_decode(vh.class_ids, vh.class_table))
+                columns["vh_resource_id"].append(_decode(vh.resource_id_ids, vh.resource_id_table))
+                columns["vh_package"].append(_decode(vh.package_ids, vh.package_table))
+                columns["vh_text"].append(vh.text)
+                columns["vh_content_description"].append(vh.content_description)
+            else:
+                for name in ("vh_bounds", "vh_flags", "vh_parent", "vh_class", "vh_resource_id", "vh_package",
+                             "vh_text", "vh_content_description"):
+                    columns[name].append([])
+    return columns
+
+
+def export_trajectories(roots: Iterable[str], output_path: str, screenshot_bytes: bool = False,
+                        row_group_steps: int = 1024) -> int:
+    """
+    Stream the episodes of captured_data trees into a Parquet dataset partitioned by category,
+    <output_path>/category=<category>/part-<export id>.parquet, one row per step (see trajectory_schema).
+    Every export writes new part files, so exporting more runs into the same dataset adds to it.
+
+    Episodes are read one at a time and written in row groups of about row_group_steps steps, so
+    the memory used does not grow with the number of episodes.
+
+    Args:
+        roots (list): captured_data trees, <root>/<category>/<episode>, with directories or archives.
+        screenshot_bytes (bool): Also store the encoded screenshots in a "screenshot" column, instead
+            of only their paths (which read_artifact resolves, archived or not).
+
+    Returns:
+        int: Number of steps written.
+    """
+    pa, pq = _import_pyarrow()
+    schema = trajectory_schema(screenshot_bytes)
+    writers, pending, rows = {}, {}, 0
+    part_name = f"part-{uuid.uuid4().hex}.parquet"
+
+    def write(category: str) -> None:
+        if category not in writers:
+            partition_path = os.path.join(output_path, f"category={category}")
+            os.makedirs(partition_path, exist_ok=True)
+            writers[category] = pq.ParquetWriter(os.path.join(partition_path, part_name), schema)
+        writers[category].write_table(pa.concat_tables(pending.pop(category)))
+
+    try:
+        for root in roots:
+            for episode_dir in iter_episode_dirs(root):
+                category = os.path.basename(os.path.dirname(episode_dir))
+                try:
+                    table = pa.Table.from_pydict(episode_rows(episode_dir, screenshot_bytes), schema=schema)
+                except (OSError, ValueError) as e:
+                    logger.error(f"can not export {episode_dir}: {e}")
+                    continue
+                pending.setdefault(category, []).append(table)
+                rows += table.num_rows
+                if sum(table.num_rows for table in pending[category]) >= row_group_steps:
+                    write(category)
+        for category in list(pending):
+            write(category)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    logger.info(f"exported {rows} steps of {len(writers)} categories to {output_path}")
+    return rows
+
+
+def load_trajectories(dataset_path: str, columns: List[str] = None, filters=None):
+    """
+    Read an exported dataset, memory-mapped, e.g.
+    `load_trajectories(path, columns=["run", "episode", "step", "action_type"], filters=[("category", "=", "general")])`.
+
+    Returns:
+        pyarrow.Table: The selected rows and columns, "category" included as a column.
+    """
+    _, pq = _import_pyarrow()
+    return pq.read_table(dataset_path, columns=columns, filters=filters, memory_map=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("export captured_data trees to a Parquet dataset partitioned by category")
+    parser.add_argument("roots", nargs="+", help="captured_data trees, <root>/<category>/<episode>/captured_data")
+    parser.add_argument("--output", required=True, help="directory of the dataset")
+    parser.add_argument("--screenshot-bytes", action="store_true", help="embed the encoded screenshots")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    export_trajectories(args.roots, args.output, screenshot_bytes=args.screenshot_bytes)
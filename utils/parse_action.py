@@ -1,52 +1,135 @@
 import numpy as np
-from typing import Dict
 import logging
-from typing import Any, Dict
+import math
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple, Union
 
 # Adapted from AITW
 _SWIPE_DISTANCE_THRESHOLD = 0.04
 def is_tap_action(normalized_start_yx, normalized_end_yx):
 
-    distance = np.linalg.norm(
-    np.array(normalized_start_yx) - np.array(normalized_end_yx))
+    distance = math.hypot(*(start - end for start, end in zip(normalized_start_yx, normalized_end_yx)))
     return distance <= _SWIPE_DISTANCE_THRESHOLD
 
 
-# Splitting the action string into key-value pairs
-def parse_action_string(action_str):
+def is_tap_actions(touch_points: np.ndarray, lift_points: np.ndarray) -> np.ndarray:
+    """is_tap_action of N (touch, lift) pairs at once, points are (N, 2) arrays."""
+    delta = np.asarray(touch_points) - np.asarray(lift_points)
+    return np.hypot(delta[:, 0], delta[:, 1]) <= _SWIPE_DISTANCE_THRESHOLD
 
-    logging.info(f"parsing action string: {action_str}")
 
-    action_str = action_str.lower()
-    action_dict = {}
-    elements = action_str.split(", ")
-
-    # Buffer for accumulating parts of a split list
-    temp = ""
-
-    for element in elements:
-        # Check if the element is part of a split list
-        if temp:
-            temp += ", " + element
-            if element.endswith(']'):
-                # If the end of the list is found, process the whole item
-                key, value = temp.split(": ", 1)
-                action_dict[key] = eval(value)  # Convert string list to actual list
-                temp = ""  # Reset the buffer
-        elif element.count('[') != element.count(']'):
-            # If the list is split, start accumulating
-            temp = element
-        else:
-            # Process a normal item
-            key, value = element.split(":", 1)
-            # 去除空格
-            key = key.strip()
-            value = value.strip()
-            if value.startswith('[') and value.endswith(']'):
-                value = eval(value)  # Convert string list to actual list
-            action_dict[key] = value
+# codes of the action types in ActionBatch.action_type, those of the AitW dataset
+ACTION_TYPE_CODES = {
+    "TYPE": 3,
+    "DUAL_POINT": 4,
+    "PRESS_BACK": 5,
+    "PRESS_HOME": 6,
+    "PRESS_ENTER": 7,
+    "STATUS_TASK_COMPLETE": 10,
+    "STATUS_TASK_IMPOSSIBLE": 11,
+}
+UNKNOWN_ACTION_TYPE = -1
+
+
+class AITWAction(NamedTuple):
+    """
+    An action in the AitW format of docs/AITW_ACTION_FORMAT.md.
+    action_type is upper case, points are (x, y) normalized coordinates, typed_text is kept as written.
+    """
+    action_type: str
+    touch_point: Tuple[float, ...]
+    lift_point: Tuple[float, ...]
+    typed_text: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The dict parse_action_string has always returned, action_type in lower case and points as lists."""
+        return {
+            "action_type": self.action_type.lower(),
+            "touch_point": list(self.touch_point),
+            "lift_point": list(self.lift_point),
+            "typed_text": self.typed_text,
+        }
+
+
+# the four fields exactly as documented (what agents and AgentEnv itself write), points captured coordinate by
+# coordinate; typed_text runs to the end of the string so it may hold commas and brackets
+_AITW_ACTION_RE = re.compile(
+    r"action_type: ?(\w+), touch_point: ?\[ *([^,\]]*), *([^,\]]*)\], lift_point: ?\[ *([^,\]]*), *([^,\]]*)\]"
+    r"(?:, typed_text:(.*))?",
+    re.DOTALL,
+)
+# the same with any case and spacing
+_AITW_ACTION_LENIENT_RE = re.compile(
+    r"\s*action_type\s*:\s*(\w+)\s*,\s*touch_point\s*:\s*\[([^\]]*)\]\s*,"
+    r"\s*lift_point\s*:\s*\[([^\]]*)\]\s*(?:,\s*typed_text\s*:(.*))?",
+    re.IGNORECASE | re.DOTALL,
+)
+# any field, for actions whose fields come in another order
+_AITW_FIELD_RE = re.compile(r"(?:^|,)\s*(action_type|touch_point|lift_point|typed_text)\s*:", re.IGNORECASE)
+
+
+def _parse_point(point_str: str) -> Tuple[float, ...]:
+    return tuple(map(float, point_str.split(",")))
+
+
+def _parse_fields(action_str: str) -> Dict[str, str]:
+    """Split an action string into its raw field values, in any field order."""
+    matches = list(_AITW_FIELD_RE.finditer(action_str))
+    fields = {}
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        end = next_match.start() if next_match is not None else len(action_str)
+        fields[match.group(1).lower()] = action_str[match.end():end]
+    return fields
+
+
+def parse_aitw_action(action_str: str) -> AITWAction:
+    """
+    Parse an AitW action string such as
+    "action_type: type, touch_point: [-1.0, -1.0], lift_point: [-1.0, -1.0], typed_text: best rated coffee maker".
+
+    Raises:
+        ValueError: the string has no action_type or a malformed point.
+    """
+    match = _AITW_ACTION_RE.fullmatch(action_str)
+    if match is not None:
+        action_type, touch_x, touch_y, lift_x, lift_y, typed_text = match.groups()
+        return AITWAction(action_type.upper(), (float(touch_x), float(touch_y)), (float(lift_x), float(lift_y)),
+                          typed_text.strip() if typed_text else "")
+    match = _AITW_ACTION_LENIENT_RE.fullmatch(action_str)
+    if match is not None:
+        action_type, touch_point, lift_point, typed_text = match.groups()
+    else:
+        fields = _parse_fields(action_str)
+        if "action_type" not in fields:
+            raise ValueError(f"not an AitW action: {action_str!r}")
+        action_type = fields["action_type"].strip()
+        touch_point = fields.get("touch_point", "[-1.0, -1.0]").strip().strip("[]")
+        lift_point = fields.get("lift_point", "[-1.0, -1.0]").strip().strip("[]")
+        typed_text = fields.get("typed_text")
+    return AITWAction(action_type.upper(), _parse_point(touch_point), _parse_point(lift_point),
+                      typed_text.strip() if typed_text else "")
+
+
+def parse_action_strings(action_strs: Iterable[str]) -> List[AITWAction]:
+    """
+    Parse a batch of action strings, e.g. the recorded actions of traces to score offline.
+    Recorded actions repeat a lot (status actions, back, home...), each distinct string is parsed once.
+    """
+    parsed: Dict[str, AITWAction] = {}
+    actions = []
+    for action_str in action_strs:
+        action = parsed.get(action_str)
+        if action is None:
+            action = parsed[action_str] = parse_aitw_action(action_str)
+        actions.append(action)
+    return actions
 
-    return action_dict
+
+# Splitting the action string into key-value pairs, see parse_aitw_action
+def parse_action_string(action_str):
+
+    logging.info(f"parsing action string: {action_str}")
+    return parse_aitw_action(action_str).to_dict()
 
 def parse_action(action: Dict[str,str]):
     # action_type: type or dual_point or status_task_complete or back or home...
@@ -83,3 +166,103 @@ def parse_action(action: Dict[str,str]):
 
 
 
+
+
+class ActionBatch(NamedTuple):
+    """
+    Column form of N actions, row i of every column is action i.
+    - action_type: int8 (N,) codes of ACTION_TYPE_CODES, UNKNOWN_ACTION_TYPE for other types.
+    - touch_point, lift_point: float64 (N, 2) normalized (x, y), (-1, -1) for actions without points.
+    - is_tap: bool (N,) DUAL_POINT actions whose points are close enough for a click (the others are swipes).
+    - typed_text: list of the N texts.
+    """
+    action_type: np.ndarray
+    touch_point: np.ndarray
+    lift_point: np.ndarray
+    is_tap: np.ndarray
+    typed_text: List[str]
+
+    def __len__(self) -> int:
+        return len(self.action_type)
+
+    @property
+    def is_click(self) -> np.ndarray:
+        return self.is_tap & (self.action_type == ACTION_TYPE_CODES["DUAL_POINT"])
+
+    @property
+    def is_swipe(self) -> np.ndarray:
+        return ~self.is_tap & (self.action_type == ACTION_TYPE_CODES["DUAL_POINT"])
+
+
+def decode_actions(actions: Iterable[Union[str, Dict[str, Any], AITWAction]]) -> ActionBatch:
+    """
+    Decode a batch of actions, given as action strings, parse_action_string dicts or AITWActions,
+    into an ActionBatch; the tap / swipe classification is one vectorized pass over all of them.
+    """
+    actions = list(actions)
+    parsed = iter(parse_action_strings([action for action in actions if isinstance(action, str)]))
+    action_types, points, typed_text = [], [], []
+    for action in actions:
+        if isinstance(action, dict):
+            action_types.append(ACTION_TYPE_CODES.get(action["action_type"].upper(), UNKNOWN_ACTION_TYPE))
+            points.append([*action.get("touch_point", (-1.0, -1.0)), *action.get("lift_point", (-1.0, -1.0))])
+            typed_text.append(action.get("typed_text", ""))
+            continue
+        if isinstance(action, str):
+            action = next(parsed)
+        action_types.append(ACTION_TYPE_CODES.get(action.action_type, UNKNOWN_ACTION_TYPE))
+        points.append(action.touch_point + action.lift_point)
+        typed_text.append(action.typed_text)
+    points = np.array(points, dtype=np.float64).reshape(len(actions), 4)
+    touch_point, lift_point = points[:, :2], points[:, 2:]
+    return ActionBatch(np.array(action_types, dtype=np.int8), touch_point, lift_point,
+                       is_tap_actions(touch_point, lift_point), typed_text)
+
+
+class ActionRecord(NamedTuple):
+    """
+    An action as AgentEnv records it in captured_data/action/<step>.action.
+    action_type is CLICK, SWIPE, TYPE, PRESS_*, STATUS_TASK_*, or INTENT / Oracle for adb commands and
+    oracle actions; points are normalized (x, y), None for actions without points; typed_text is the
+    text of TYPE and the whole record of INTENT / Oracle; width and height are the screen size, if recorded.
+    """
+    action_type: str
+    touch_point: Tuple[float, float]
+    lift_point: Tuple[float, float]
+    typed_text: str
+    width: int
+    height: int
+
+
+def _parse_record_point(point_str: str, width: int, height: int) -> Tuple[float, float]:
+    if point_str == "NULL":
+        return None
+    x, y = _parse_point(point_str.strip().strip("[]"))
+    if width and height and (x > 1 or y > 1):
+        # a point in pixels
+        x, y = x / width, y / height
+    return x, y
+
+
+def parse_action_record(record: str) -> ActionRecord:
+    """
+    Parse a recorded action, "CLICK|[0.5, 0.3]|NULL|1080|2400", "SWIPE|[0.5, 0.8]|[0.5, 0.2]|1080|2400",
+    "TYPE|best rated coffee maker|NULL|1080|2400"..., see AgentEnv._trans_action_format.
+
+    Raises:
+        ValueError: a CLICK or SWIPE with a malformed point.
+    """
+    record = record.strip()
+    action_type, _, fields = record.partition("|")
+    # the typed text may hold "|", the last three fields never do
+    fields = fields.rsplit("|", 3)
+    if action_type.startswith("Oracle") or len(fields) < 4 or not (fields[2].isdigit() and fields[3].isdigit()):
+        # adb commands ("am start ...") and oracle actions are recorded as given (or as their JSON dict)
+        return ActionRecord("Oracle" if action_type.startswith("Oracle") else "INTENT", None, None, record, None, None)
+    parameter, lift_point, width, height = fields[0], fields[1], int(fields[2]), int(fields[3])
+    if action_type == "CLICK":
+        return ActionRecord(action_type, _parse_record_point(parameter, width, height), None, "", width, height)
+    if action_type == "SWIPE":
+        return ActionRecord(action_type, _parse_record_point(parameter, width, height),
+                            _parse_record_point(lift_point, width, height), "", width, height)
+    return ActionRecord(action_type, None, None, parameter if action_type == "TYPE" else "", width, height)
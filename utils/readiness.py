@@ -0,0 +1,86 @@
+import logging
+import time
+from typing import Callable, Dict
+
+from utils.adb_client import get_adb_client
+
+# default deadline (seconds) of each readiness stage
+DEFAULT_READINESS_DEADLINES = {
+    "boot_completed": 120,
+    "package_manager": 30,
+    "uiautomator": 30,
+}
+
+
+class ReadinessTimeout(Exception):
+    def __init__(self, message="Device not ready", *args, **kwargs):
+        super().__init__(message, *args, **kwargs)
+
+
+class ReadinessProbe:
+    """
+    Poll an emulator until it is really usable instead of sleeping for a fixed time.
+
+    The probe runs in stages, each one with its own deadline:
+    - boot_completed: `getprop sys.boot_completed` returns 1.
+    - package_manager: `pm path android` answers, so apps can be started and listed.
+    - uiautomator: the uiautomator2 server answers an RPC, checked once the Device is connected.
+    """
+    def __init__(self, device_serial: str, deadlines: Dict[str, float] = None, poll_interval: float = 0.5) -> None:
+        self.device_serial = device_serial
+        self.deadlines = dict(DEFAULT_READINESS_DEADLINES)
+        if deadlines:
+            self.deadlines.update(deadlines)
+        self.poll_interval = poll_interval
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def _adb_shell(self, cmd: str) -> str:
+        return get_adb_client().shell(self.device_serial, cmd, timeout=10).strip()
+
+    def _wait_for(self, stage: str, check: Callable[[], bool]) -> float:
+        """
+        Call check until it returns True, return the time it took.
+
+        Raises:
+            ReadinessTimeout: check did not succeed before the deadline of the stage.
+        """
+        start_time = time.time()
+        deadline = start_time + self.deadlines[stage]
+        while True:
+            try:
+                if check():
+                    elapsed = time.time() - start_time
+                    self.logger.info(f"{self.device_serial} {stage} ready after {elapsed:.2f}s")
+                    return elapsed
+            except Exception as e:
+                self.logger.debug(f"{self.device_serial} {stage} not ready: {e}")
+            if time.time() > deadline:
+                raise ReadinessTimeout(f"{self.device_serial} {stage} not ready after {self.deadlines[stage]}s")
+            time.sleep(self.poll_interval)
+
+    def wait_for_boot(self) -> float:
+        return self._wait_for("boot_completed", lambda: self._adb_shell("getprop sys.boot_completed") == "1")
+
+    def wait_for_package_manager(self) -> float:
+        return self._wait_for("package_manager", lambda: self._adb_shell("pm path android").startswith("package:"))
+
+    def wait_for_uiautomator(self, device) -> float:
+        """
+        Args:
+            device (Device): An already connected device.
+        """
+        return self._wait_for("uiautomator", device.ping)
+
+    def wait_for_emulator(self) -> Dict[str, float]:
+        """
+        Wait until the emulator has booted and its package manager answers.
+
+        Returns:
+            dict: Latency of each stage in seconds, plus their "total".
+        """
+        latencies = {
+            "boot_completed": self.wait_for_boot(),
+            "package_manager": self.wait_for_package_manager(),
+        }
+        latencies["total"] = sum(latencies.values())
+        return latencies
@@ -0,0 +1,85 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional
+
+STARTED = "started"
+COMPLETED = "completed"
+
+
+class RunLedger:
+    """
+    Durable record of the episodes of a run, so that an interrupted run can be resumed.
+
+    The ledger is a JSON file {episode: {"status", "output_path", "steps", "timings", "started_at",
+    "finished_at"}}. It is rewritten after every change through a temporary file and os.replace,
+    so a crash leaves either the previous or the new version on disk, never a truncated one.
+    An episode still "started" when the run is resumed was interrupted while it was written.
+    """
+    def __init__(self, path: str) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self._lock = threading.Lock()
+        self.episodes: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.episodes = json.load(file)
+            completed = sum(record["status"] == COMPLETED for record in self.episodes.values())
+            self.logger.info(f"resuming from {path}: {completed} completed episodes")
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".run_ledger_", suffix=".tmp",
+                                         delete=False, encoding="utf-8") as file:
+            json.dump(self.episodes, file, indent=4, default=str)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, self.path)
+
+    def status(self, episode) -> Optional[str]:
+        with self._lock:
+            record = self.episodes.get(str(episode))
+            return record["status"] if record is not None else None
+
+    def is_completed(self, episode) -> bool:
+        return self.status(episode) == COMPLETED
+
+    def mark_started(self, episode, output_path: str) -> None:
+        with self._lock:
+            self.episodes[str(episode)] = {
+                "status": STARTED,
+                "output_path": output_path,
+                "started_at": time.time(),
+            }
+            self._save()
+
+    def mark_completed(self, episode, steps: int, timings: Dict[str, Any] = None) -> None:
+        with self._lock:
+            record = self.episodes.setdefault(str(episode), {})
+            record.update({
+                "status": COMPLETED,
+                "steps": steps,
+                "timings": timings or {},
+                "finished_at": time.time(),
+            })
+            self._save()
+
+
+_ledgers: Dict[str, RunLedger] = {}
+_ledgers_lock = threading.Lock()
+
+
+def open_run_ledger(path: str) -> RunLedger:
+    """
+    The RunLedger of path, shared by all the AgentEnvs of the process (e.g. the workers of an EmulatorPool).
+    """
+    key = os.path.abspath(path)
+    with _ledgers_lock:
+        ledger = _ledgers.get(key)
+        if ledger is None:
+            ledger = _ledgers[key] = RunLedger(path)
+        return ledger
@@ -0,0 +1,130 @@
+import io
+import os
+from typing import Any, Dict, Tuple
+
+import numpy as np
+from PIL import Image
+
+# format: (PIL format, file extension); "raw" screenshots are uncompressed (H, W, 3) uint8 .npy arrays
+SCREENSHOT_FORMATS = {
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+    "raw": (None, ".npy"),
+}
+SCREENSHOT_EXTENSIONS = tuple(extension for _, extension in SCREENSHOT_FORMATS.values())
+
+
+class ScreenshotCodec:
+    """
+    How screenshots are written: format, compression and size.
+
+    - png: lossless, compress_level 0 (fastest, largest) to 9, PIL's default (6) when None.
+    - webp: lossless=True for lossless WebP, else lossy at quality (PIL's default 80 when None).
+    - jpeg: lossy at quality (PIL's default 75 when None), for captures only used for training.
+    - raw: the uncompressed RGB array as .npy, the fastest to write, to be encoded later in batch
+      (see transcode_screenshots).
+
+    scale (e.g. 0.5) or size (width, height) resize the screenshot before it is encoded. The
+    default codec writes full size PNGs at PIL's default settings.
+    """
+    def __init__(self, format: str = "png", compress_level: int = None, quality: int = None,
+                 lossless: bool = False, scale: float = 1.0, size: Tuple[int, int] = None) -> None:
+        if format not in SCREENSHOT_FORMATS:
+            raise ValueError(f"unknown screenshot format {format!r}, expected one of {list(SCREENSHOT_FORMATS)}")
+        self.format = format
+        self.compress_level = compress_level
+        self.quality = quality
+        self.lossless = lossless
+        self.scale = scale
+        self.size = tuple(size) if size is not None else None
+
+    @property
+    def extension(self) -> str:
+        return SCREENSHOT_FORMATS[self.format][1]
+
+    def _save_options(self) -> Dict[str, Any]:
+        options = {}
+        if self.format == "png" and self.compress_level is not None:
+            options["compress_level"] = self.compress_level
+        elif self.format == "webp":
+            options["lossless"] = self.lossless
+            if self.quality is not None:
+                options["quality"] = self.quality
+        elif self.format == "jpeg" and self.quality is not None:
+            options["quality"] = self.quality
+        return options
+
+    def prepare(self, image) -> Image.Image:
+        """The screenshot resized as configured, in RGB for the formats without alpha."""
+        size = self.size
+        if size is None and self.scale != 1.0:
+            size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+        if size is not None and image.size != tuple(size):
+            image = image.resize(size, Image.BILINEAR)
+        if self.format in ("jpeg", "raw") and image.mode != "RGB":
+            image = image.convert("RGB")
+        return image
+
+    def round_trips(self, image) -> bool:
+        """Whether decoding the saved screenshot gives back image unchanged: same size, mode and pixels."""
+        if self.size is not None and image.size != self.size:
+            return False
+        if self.size is None and self.scale != 1.0:
+            return False
+        if self.format == "png":
+            return True
+        if self.format == "webp":
+            return self.lossless and image.mode in ("RGB", "RGBA")
+        if self.format == "raw":
+            return image.mode == "RGB"
+        return False
+
+    def write(self, file, image) -> None:
+        """Encode image into a binary file object."""
+        image = self.prepare(image)
+        if self.format == "raw":
+            np.save(file, np.asarray(image))
+        else:
+            image.save(file, format=SCREENSHOT_FORMATS[self.format][0], **self._save_options())
+
+    def encode(self, image) -> bytes:
+        buffer = io.BytesIO()
+        self.write(buffer, image)
+        return buffer.getvalue()
+
+    def save(self, path: str, image) -> None:
+        with open(path, "wb") as file:
+            self.write(file, image)
+
+
+def decode_screenshot(data: bytes, path: str = "") -> Image.Image:
+    """A screenshot read back from its bytes, whatever the codec; path tells raw .npy screenshots apart."""
+    if path.endswith(".npy"):
+        return Image.fromarray(np.load(io.BytesIO(data)))
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+    return image
+
+
+def transcode_screenshots(captured_data_path: str, codec: ScreenshotCodec) -> int:
+    """
+    Encode the screenshots of a captured_data directory with codec, e.g. the raw .npy screenshots of a
+    run once it is over, replacing the original files.
+
+    Returns:
+        int: Number of screenshots transcoded.
+    """
+    screenshot_dir = os.path.join(captured_data_path, "screenshot")
+    transcoded = 0
+    for name in sorted(os.listdir(screenshot_dir)):
+        stem, extension = os.path.splitext(name)
+        if extension not in SCREENSHOT_EXTENSIONS or extension == codec.extension:
+            continue
+        path = os.path.join(screenshot_dir, name)
+        with open(path, "rb") as file:
+            image = decode_screenshot(file.read(), path)
+        codec.save(os.path.join(screenshot_dir, stem + codec.extension), image)
+        os.remove(path)
+        transcoded += 1
+    return transcoded
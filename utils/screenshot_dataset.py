@@ -0,0 +1,147 @@
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.screenshot_codec import decode_screenshot
+from utils.trace_archive import EpisodeArtifacts, iter_episode_dirs
+from utils.trace_index import episode_key
+
+logger = logging.getLogger(__name__)
+
+
+def _index_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _decode_episode(episode_dir: str, steps: List[int], size: Tuple[int, int]) -> List[np.ndarray]:
+    with EpisodeArtifacts(episode_dir) as artifacts:
+        images = []
+        for step in steps:
+            path = artifacts.steps[step]["screenshot"]
+            image = decode_screenshot(artifacts.read(path), path).convert("RGB")
+            if image.size != size:
+                image = image.resize(size, Image.BILINEAR)
+            images.append(np.asarray(image))
+        return images
+
+
+def pack_screenshots(episode_dirs: Iterable[str], output_path: str, size: Tuple[int, int] = None,
+                     scale: float = 1.0, workers: int = 4) -> int:
+    """
+    Decode the screenshots of recorded episodes once into one uint8 array file of shape (N, H, W, 3),
+    output_path (.npy), with its index next to it (.json): the episode directory (absolute, unique
+    across runs), run, category, episode, step and source path of every row, in episode then step order.
+
+    Args:
+        episode_dirs (list): Recorded episodes, <category>/<episode> with a captured_data directory or archive.
+        size (tuple): (width, height) every screenshot is resized to, by default the size of the
+            first screenshot times scale.
+        scale (float): Downscale factor applied to the first screenshot's size when size is not given.
+        workers (int): Threads decoding the episodes (PIL releases the GIL while decoding).
+
+    Returns:
+        int: Number of screenshots packed.
+    """
+    rows: List[Dict[str, Any]] = []
+    episodes: List[Tuple[str, List[int]]] = []
+    for episode_dir in episode_dirs:
+        episode_dir, run, category, episode = episode_key(episode_dir)
+        with EpisodeArtifacts(episode_dir) as artifacts:
+            steps = [step for step, paths in sorted(artifacts.steps.items()) if "screenshot" in paths]
+            if steps and size is None:
+                path = artifacts.steps[steps[0]]["screenshot"]
+                image = decode_screenshot(artifacts.read(path), path)
+                size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            rows.extend({
+                "episode_dir": episode_dir,
+                "run": run,
+                "category": category,
+                "episode": episode,
+                "step": step,
+                "path": artifacts.steps[step]["screenshot"],
+            } for step in steps)
+        if steps:
+            episodes.append((episode_dir, steps))
+    if not rows:
+        raise ValueError("no screenshot to pack")
+
+    width, height = size
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    array = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=(len(rows), height, width, 3))
+    offset = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # a window of 2 * workers episodes at a time, so decoded images never pile up in memory
+        window = 2 * workers
+        for start in range(0, len(episodes), window):
+            decoded = executor.map(lambda episode: _decode_episode(episode[0], episode[1], size), episodes[start:start + window])
+            for images in decoded:
+                array[offset:offset + len(images)] = np.stack(images)
+                offset += len(images)
+    array.flush()
+    del array
+    with open(_index_path(output_path), "w", encoding="utf-8") as file:
+        json.dump({"shape": [len(rows), height, width, 3], "rows": rows}, file)
+    logger.info(f"packed {len(rows)} screenshots of {len(episodes)} episodes at {width}x{height} into {output_path}")
+    return len(rows)
+
+
+class ScreenshotDataset:
+    """
+    Screenshots packed by pack_screenshots, memory-mapped: rows are read straight from the page cache
+    without decoding, dataset[i] is a (H, W, 3) uint8 view and dataset.batch(indices) one copy of N rows.
+
+    Rows are looked up by episode directory, <run>/<category>/<episode>, since the same episode id
+    may have been packed from several runs.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.images = np.load(path, mmap_mode="r")
+        with open(_index_path(path), "r", encoding="utf-8") as file:
+            self.rows: List[Dict[str, Any]] = json.load(file)["rows"]
+        self._positions = {(row["episode_dir"], row["step"]): i for i, row in enumerate(self.rows)}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, i) -> np.ndarray:
+        return self.images[i]
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.images.shape
+
+    def batch(self, indices: Sequence[int]) -> np.ndarray:
+        """The rows at indices, sorted first so that the file is read in order."""
+        indices = np.asarray(indices)
+        order = np.argsort(indices, kind="stable")
+        batch = np.empty((len(indices),) + self.images.shape[1:], dtype=np.uint8)
+        batch[order] = self.images[indices[order]]
+        return batch
+
+    def index_of(self, episode_dir: str, step: int) -> int:
+        """Row of the screenshot of step in the episode recorded in episode_dir, KeyError if it was not packed."""
+        return self._positions[(episode_key(episode_dir)[0], step)]
+
+    def episode_indices(self, episode_dir: str) -> List[int]:
+        """Rows of the episode recorded in episode_dir, in step order."""
+        episode_dir = episode_key(episode_dir)[0]
+        return [i for i, row in enumerate(self.rows) if row["episode_dir"] == episode_dir]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("pack the screenshots of captured_data trees into a memory-mappable array")
+    parser.add_argument("roots", nargs="+", help="captured_data trees, <root>/<category>/<episode>/captured_data")
+    parser.add_argument("--output", required=True, help="the .npy file, its index is written next to it as .json")
+    parser.add_argument("--size", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"), default=None)
+    parser.add_argument("--scale", type=float, default=1.0, help="downscale factor when --size is not given")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    pack_screenshots([episode_dir for root in args.roots for episode_dir in iter_episode_dirs(root)], args.output,
+                     size=tuple(args.size) if args.size else None, scale=args.scale, workers=args.workers)
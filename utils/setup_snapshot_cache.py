@@ -0,0 +1,177 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from utils.adb_client import AdbClient, AdbError, get_adb_client
+
+# package of the app each setup module drives, its version is part of the cache key
+SETUP_MODULE_PACKAGES = {
+    "Coursera": "org.coursera.android",
+    "Crunchyroll": "com.crunchyroll.crunchyroid",
+    "Discord": "com.discord",
+    "DoorDash": "com.dd.doordash",
+    "ESPN": "com.espn.score_center",
+    "Facebook": "com.facebook.katana",
+    "GoogleDrive": "com.google.android.apps.docs",
+    "GoogleTask": "com.google.android.apps.tasks",
+    "NewsBreak": "com.particlenews.newsbreak",
+    "Pinterest": "com.pinterest",
+    "Quora": "com.quora.android",
+    "Trello": "com.trello",
+    "X": "com.twitter.android",
+    "Zoom": "us.zoom.videomeetings",
+}
+
+_VERSION_NAME_RE = re.compile(r"versionName=(\S+)")
+
+
+def parse_snapshot_list(output: str) -> Set[str]:
+    """
+    Names of the snapshots in the output of the console command `avd snapshot list`, a table like
+
+        List of snapshots present on all disks:
+        ID        TAG                 VM SIZE                DATE       VM CLOCK
+        --        default_boot           361M 2024-05-02 10:21:53   00:00:26.545
+
+    whose rows start with an ID ("--" or a number) followed by the snapshot name (TAG).
+    """
+    names = set()
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) >= 2 and (fields[0] == "--" or fields[0].isdigit()):
+            names.add(fields[1])
+    return names
+
+
+class SetupSnapshotCache:
+    """
+    Emulator snapshots of the device state right after a task setup succeeded.
+
+    The index is a JSON file {key: {"snapshot", "setup", "app_version", "instruction", "saved_at"}}
+    where the key is "<avd>/<setup class>@<app version>": a snapshot is only reused on the AVD it
+    was saved on and while the app the setup drives is still the same version (for the setups of
+    system settings, the build fingerprint stands for the version). The snapshots themselves live
+    in the AVD and are saved and loaded through the emulator console.
+    """
+    def __init__(self, path: str, adb: AdbClient = None) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.adb = adb or get_adb_client()
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".setup_snapshots_", suffix=".tmp",
+                                         delete=False, encoding="utf-8") as file:
+            json.dump(self.entries, file, indent=4)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, self.path)
+
+    def app_version(self, serial: str, setup_class: type) -> str:
+        """
+        Version of the app setup_class drives on the device, read with `dumpsys package`.
+
+        Returns:
+            str: The versionName of the app, the build fingerprint for setups without app, "unknown"
+            if it can not be read.
+        """
+        package = SETUP_MODULE_PACKAGES.get(setup_class.__module__.rsplit(".", 1)[-1])
+        try:
+            if package is None:
+                return self.adb.shell(serial, "getprop ro.build.fingerprint").strip() or "unknown"
+            match = _VERSION_NAME_RE.search(self.adb.shell(serial, f"dumpsys package {package}"))
+            return match.group(1) if match else "unknown"
+        except AdbError as e:
+            self.logger.warning(f"can not read the version of {package or 'the build'} on {serial}: {e}")
+            return "unknown"
+
+    @staticmethod
+    def key(avd_name: str, setup_class: type, app_version: str) -> str:
+        return f"{avd_name}/{setup_class.__name__}@{app_version}"
+
+    @staticmethod
+    def snapshot_name(key: str) -> str:
+        """Snapshot name of key, made of the setup class and a digest of the whole key."""
+        setup_name = key.split("/", 1)[-1].split("@", 1)[0]
+        return f"setup_{setup_name}_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+
+    def lookup(self, serial: str, key: str) -> Optional[str]:
+        """
+        The snapshot saved for key, None if there is none or the emulator no longer has it.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            snapshots = parse_snapshot_list(self.adb.emu(serial, "avd snapshot list", timeout=30))
+        except AdbError as e:
+            self.logger.warning(f"can not list the snapshots of {serial}: {e}")
+            return None
+        if entry["snapshot"] not in snapshots:
+            self.logger.warning(f"snapshot {entry['snapshot']} of {key} is gone, dropped from the cache")
+            self.invalidate(key)
+            return None
+        return entry["snapshot"]
+
+    def save(self, serial: str, key: str, instruction: str) -> Optional[str]:
+        """
+        Save the current state of the emulator as the snapshot of key.
+
+        The console command is sent once, without retry nor adb emu fallback: a save that timed out
+        may still be running, sending it again would write the snapshot twice.
+
+        Returns:
+            str: The snapshot name, None if the emulator refused to save it (e.g. a read-only instance).
+        """
+        snapshot_name = self.snapshot_name(key)
+        try:
+            self.adb.emu(serial, f"avd snapshot save {snapshot_name}", timeout=120, retry=False)
+        except AdbError as e:
+            self.logger.error(f"can not save snapshot {snapshot_name} on {serial}: {e}")
+            return None
+        setup_name, app_version = key.split("/", 1)[-1].split("@", 1)
+        with self._lock:
+            self.entries[key] = {
+                "snapshot": snapshot_name,
+                "setup": setup_name,
+                "app_version": app_version,
+                "instruction": instruction,
+                "saved_at": time.time(),
+            }
+            self._save()
+        self.logger.info(f"saved snapshot {snapshot_name} for {key}")
+        return snapshot_name
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+
+
+_caches: Dict[str, SetupSnapshotCache] = {}
+_caches_lock = threading.Lock()
+
+
+def open_setup_snapshot_cache(path: str) -> SetupSnapshotCache:
+    """
+    The SetupSnapshotCache of path, shared by all the AgentEnvs of the process (e.g. the workers of an EmulatorPool).
+    """
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = SetupSnapshotCache(path)
+        return cache
@@ -0,0 +1,108 @@
+import math
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from utils.columnar_vh import ColumnarViewHierarchy, CLICKABLE, LONG_CLICKABLE
+
+
+class ViewHierarchyIndex:
+    """
+    Uniform grid over the node bounds of a view hierarchy, for hit-testing agent coordinates.
+
+    Every node with a non empty area is registered in each grid cell it overlaps, so a point query
+    only tests the few nodes of one cell. Nodes are kept in pre-order, where a node always comes
+    after the nodes drawn below it, so the top-most node hit is the one with the largest index.
+    """
+    def __init__(self, view_hierarchy: ColumnarViewHierarchy, cell_size: int = 120) -> None:
+        self.view_hierarchy = view_hierarchy
+        self.cell_size = cell_size
+        bounds = view_hierarchy.bounds
+        self.bounds = bounds
+        self.width = int(bounds[:, 2].max(initial=1))
+        self.height = int(bounds[:, 3].max(initial=1))
+        self.n_cols = max(1, -(-self.width // cell_size))
+        self.n_rows = max(1, -(-self.height // cell_size))
+
+        nodes = np.flatnonzero((bounds[:, 2] > bounds[:, 0]) & (bounds[:, 3] > bounds[:, 1]))
+        col0 = np.clip(bounds[nodes, 0] // cell_size, 0, self.n_cols - 1)
+        col1 = np.clip((bounds[nodes, 2] - 1) // cell_size, 0, self.n_cols - 1)
+        row0 = np.clip(bounds[nodes, 1] // cell_size, 0, self.n_rows - 1)
+        row1 = np.clip((bounds[nodes, 3] - 1) // cell_size, 0, self.n_rows - 1)
+        n_cols_spanned = col1 - col0 + 1
+        n_cells = n_cols_spanned * (row1 - row0 + 1)
+
+        # one entry per (node, cell) pair, k enumerates the cells of each node row by row
+        entry_node = np.repeat(nodes, n_cells)
+        k = np.arange(n_cells.sum()) - np.repeat(np.cumsum(n_cells) - n_cells, n_cells)
+        width = np.repeat(n_cols_spanned, n_cells)
+        entry_cell = (np.repeat(row0, n_cells) + k // width) * self.n_cols + np.repeat(col0, n_cells) + k % width
+        order = np.lexsort((entry_node, entry_cell))
+        self.cell_nodes = entry_node[order].astype(np.int32)
+        self.cell_offsets = np.zeros(self.n_cols * self.n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entry_cell, minlength=self.n_cols * self.n_rows), out=self.cell_offsets[1:])
+
+    @classmethod
+    def from_json(cls, view_hierarchy_json, cell_size: int = 120) -> "ViewHierarchyIndex":
+        return cls(ColumnarViewHierarchy.from_json(view_hierarchy_json), cell_size=cell_size)
+
+    def _cell_candidates(self, cell: int) -> np.ndarray:
+        return self.cell_nodes[self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+
+    def hit_test(self, x: float, y: float, flags: int = 0) -> Optional[int]:
+        """
+        Index of the top-most node containing the pixel (x, y) and having all the flags set, None if there is none.
+        """
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return None
+        cell = int(y // self.cell_size) * self.n_cols + int(x // self.cell_size)
+        candidates = self._cell_candidates(cell)
+        bounds = self.bounds[candidates]
+        mask = (bounds[:, 0] <= x) & (x < bounds[:, 2]) & (bounds[:, 1] <= y) & (y < bounds[:, 3])
+        if flags:
+            mask &= self.view_hierarchy.has_flags(flags)[candidates]
+        hits = candidates[mask]
+        if len(hits) == 0:
+            return None
+        return int(hits[-1])
+
+    def hit_test_normalized(self, x: float, y: float, screen_width: int, screen_height: int,
+                            flags: int = 0) -> Optional[int]:
+        """Same as hit_test for AITW normalized coordinates."""
+        return self.hit_test(x * screen_width, y * screen_height, flags=flags)
+
+    def query_region(self, rect: Sequence[float], flags: int = 0) -> np.ndarray:
+        """
+        Indices, in pre-order, of the non empty nodes intersecting rect (x0, y0, x1, y1) and having all the flags set.
+        """
+        x0, y0, x1, y1 = rect
+        # the last pixel column and row overlapped by the rect are ceil(x1) - 1 and ceil(y1) - 1
+        col0, col1 = max(0, int(x0 // self.cell_size)), min(self.n_cols - 1, (math.ceil(x1) - 1) // self.cell_size)
+        row0, row1 = max(0, int(y0 // self.cell_size)), min(self.n_rows - 1, (math.ceil(y1) - 1) // self.cell_size)
+        if col0 > col1 or row0 > row1:
+            return np.empty(0, dtype=np.int32)
+        cells = [self._cell_candidates(row * self.n_cols + col)
+                 for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+        candidates = np.unique(np.concatenate(cells))
+        bounds = self.bounds[candidates]
+        mask = (bounds[:, 0] < x1) & (bounds[:, 2] > x0) & (bounds[:, 1] < y1) & (bounds[:, 3] > y0)
+        if flags:
+            mask &= self.view_hierarchy.has_flags(flags)[candidates]
+        return candidates[mask]
+
+    def interactive_ancestor(self, i: int) -> Optional[int]:
+        """
+        The node itself or its closest ancestor that is clickable or long clickable, None if there is none.
+        """
+        flags, parent = self.view_hierarchy.flags, self.view_hierarchy.parent
+        while i >= 0:
+            if flags[i] & (CLICKABLE | LONG_CLICKABLE):
+                return i
+            i = int(parent[i])
+        return None
+
+    def describe(self, i: int) -> Dict[str, Any]:
+        """Short description of node i, used to annotate actions."""
+        node = self.view_hierarchy.node(i)
+        return {key: node[key] for key in ("temp_id", "class", "resource_id", "text", "content_description",
+                                           "bounds", "clickable", "long_clickable")}
@@ -0,0 +1,50 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+
+class StateCapture:
+    """
+    Read the view hierarchy, top activity and screenshot of a device concurrently.
+
+    Each read is a separate uiautomator2 round trip, running them on a small thread pool makes
+    the capture as slow as the slowest read instead of their sum. With max_workers=1 the reads
+    run one after another in the calling thread.
+    """
+    def __init__(self, device, max_workers: int = 3) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.readers: Dict[str, Callable[[], Any]] = {
+            "view_hierarchy": device.get_viewhierachy,
+            "activity_name": device.get_top_activity_name,
+            "screenshot": device.get_screenshot,
+        }
+        self.executor = None
+        if max_workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=self.__class__.__name__)
+
+    @staticmethod
+    def _timed_read(reader: Callable[[], Any]) -> tuple[Any, float]:
+        start_time = time.perf_counter()
+        value = reader()
+        return value, time.perf_counter() - start_time
+
+    def capture(self) -> tuple[Dict[str, Any], Dict[str, float]]:
+        """
+        Returns:
+            tuple: ({field: value}, {field: seconds}) where the timings also hold the wall clock "capture_total".
+        """
+        start_time = time.perf_counter()
+        if self.executor is None:
+            reads = {field: self._timed_read(reader) for field, reader in self.readers.items()}
+        else:
+            futures = {field: self.executor.submit(self._timed_read, reader) for field, reader in self.readers.items()}
+            reads = {field: future.result() for field, future in futures.items()}
+        values = {field: value for field, (value, _) in reads.items()}
+        timings = {field: elapsed for field, (_, elapsed) in reads.items()}
+        timings["capture_total"] = time.perf_counter() - start_time
+        return values, timings
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,97 @@
+import json
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator
+
+from utils.columnar_vh import ColumnarViewHierarchy
+from utils.screenshot_codec import ScreenshotCodec, decode_screenshot
+from utils.trace_archive import read_artifact
+
+
+def _load_image(path: str):
+    return decode_screenshot(read_artifact(path), path)
+
+
+def _load_text(path: str) -> str:
+    return read_artifact(path).decode("utf-8")
+
+
+def _load_json(path: str) -> Any:
+    return json.loads(read_artifact(path))
+
+
+class LazyState(Mapping):
+    """
+    A state of AgentEnv.get_state whose screenshot and view hierarchies were dropped from memory.
+
+    It reads like the original dict; the heavy fields are reloaded from the files get_state wrote,
+    every time they are accessed (or from the episode archive with a TraceArchiveWriter), so nothing
+    large stays referenced by the history. keep_screenshot keeps the screenshot in memory instead, for
+    screenshots saved lossy or resized, which would not be reloaded as they were captured.
+    """
+    # field: (field holding the path of the file it is reloaded from, loader)
+    _LOADERS: Dict[str, tuple[str, Callable[[str], Any]]] = {
+        "screenshot": ("screenshot_path", _load_image),
+        "view_hierarchy": ("view_hierarchy_path", _load_text),
+        "view_hierarchy_json": ("view_hierarchy_json_path", _load_json),
+    }
+
+    def __init__(self, state: Dict[str, Any], before_load: Callable[[], Any] = None,
+                 keep_screenshot: bool = False) -> None:
+        kept = ("screenshot",) if keep_screenshot else ()
+        self._fields = {key: value for key, value in state.items() if key not in self._LOADERS or key in kept}
+        self._lazy_fields = [key for key in state if key in self._LOADERS and key not in kept]
+        self._has_columnar = self._fields.pop("view_hierarchy_columnar", None) is not None
+        self._before_load = before_load # e.g. flush pending asynchronous writes
+
+    def _load(self, key: str) -> Any:
+        if self._before_load is not None:
+            self._before_load()
+        path_key, loader = self._LOADERS[key]
+        return loader(self._fields[path_key])
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields:
+            return self._fields[key]
+        if key in self._lazy_fields:
+            return self._load(key)
+        if key == "view_hierarchy_columnar" and self._has_columnar:
+            return ColumnarViewHierarchy.from_json(self._load("view_hierarchy_json"))
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._lazy_fields
+        yield from self._fields
+        if self._has_columnar:
+            yield "view_hierarchy_columnar"
+
+    def __len__(self) -> int:
+        return len(self._fields) + len(self._lazy_fields) + int(self._has_columnar)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._fields})"
+
+
+class StateHistory(list):
+    """
+    List of the states of an episode that keeps only the last max_in_memory states fully in memory,
+    older ones are replaced by LazyState handles. max_in_memory=None keeps every state in memory.
+
+    With the screenshot_codec the screenshots were saved with, the screenshots it does not save
+    losslessly at full size stay in memory, so the history always returns the captured screenshots.
+    """
+    def __init__(self, max_in_memory: int = None, before_load: Callable[[], Any] = None,
+                 screenshot_codec: ScreenshotCodec = None) -> None:
+        super().__init__()
+        self.max_in_memory = max_in_memory
+        self.before_load = before_load
+        self.screenshot_codec = screenshot_codec
+
+    def append(self, state: Dict[str, Any]) -> None:
+        super().append(state)
+        if self.max_in_memory is not None and len(self) > self.max_in_memory:
+            evicted = len(self) - self.max_in_memory - 1
+            state = self[evicted]
+            if not isinstance(state, LazyState):
+                keep_screenshot = (self.screenshot_codec is not None and state.get("screenshot") is not None
+                                   and not self.screenshot_codec.round_trips(state["screenshot"]))
+                self[evicted] = LazyState(state, before_load=self.before_load, keep_screenshot=keep_screenshot)
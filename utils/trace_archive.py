@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+import warnings
+import zipfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+from utils.artifact_writer import ArtifactWriter
+from utils.screenshot_codec import ScreenshotCodec, decode_screenshot
+from utils.tracing import Tracer
+
+ARCHIVE_NAME = "captured_data.zip"
+_CAPTURED_DATA = f"{os.sep}captured_data{os.sep}"
+
+
+def archive_location(path: str) -> Optional[Tuple[str, str]]:
+    """
+    Where the artifact at path lives in archive mode.
+
+    Returns:
+        tuple: (archive path, member name), e.g. ("out/general/123/captured_data.zip", "screenshot/0.png")
+        for "out/general/123/captured_data/screenshot/0.png"; None for paths outside a captured_data directory.
+    """
+    path = os.path.normpath(path)
+    index = path.rfind(_CAPTURED_DATA)
+    if index < 0:
+        return None
+    return os.path.join(path[:index], ARCHIVE_NAME), path[index + len(_CAPTURED_DATA):].replace(os.sep, "/")
+
+
+def read_artifact(path: str) -> bytes:
+    """
+    Content of an artifact written by AgentEnv, from the file at path or else from the episode archive.
+
+    Raises:
+        FileNotFoundError: neither the file nor an archived copy exists.
+    """
+    if os.path.exists(path):
+        with open(path, "rb") as file:
+            return file.read()
+    location = archive_location(path)
+    if location is not None and os.path.exists(location[0]):
+        with zipfile.ZipFile(location[0], "r") as archive:
+            try:
+                return archive.read(location[1])
+            except KeyError:
+                pass
+    raise FileNotFoundError(path)
+
+
+class TraceArchiveWriter(ArtifactWriter):
+    """
+    ArtifactWriter storing the captured_data artifacts of each episode in one zip archive,
+    <episode>/captured_data.zip, instead of one file per artifact in six directories.
+
+    Members are stored uncompressed (ZIP_STORED: screenshots are already compressed images and
+    the rest is small) under their path relative to captured_data, e.g. "vh/3.vh". The archive
+    of the current episode stays open for appending, flush() closes it so that the zip central
+    directory, i.e. the offset table used for random access, is on disk; later writes append to
+    it again. Artifacts outside a captured_data directory are written to files as before.
+    """
+    def __init__(self, tracer: Tracer = None, screenshot_codec: ScreenshotCodec = None) -> None:
+        super().__init__(tracer, screenshot_codec)
+        self._archives: Dict[str, zipfile.ZipFile] = {}
+        self._lock = threading.Lock()
+
+    def _write(self, location: Tuple[str, str], data: bytes) -> None:
+        archive_path, member = location
+        with self._lock:
+            archive = self._archives.get(archive_path)
+            if archive is None:
+                os.makedirs(os.path.dirname(archive_path) or ".", exist_ok=True)
+                archive = self._archives[archive_path] = zipfile.ZipFile(archive_path, "a", compression=zipfile.ZIP_STORED)
+            with warnings.catch_warnings():
+                # an artifact written again is appended again, readers get the last copy
+                warnings.simplefilter("ignore", UserWarning)
+                archive.writestr(member, data)
+
+    def write_text(self, path: str, text: str) -> None:
+        location = archive_location(path)
+        if location is None:
+            return super().write_text(path, text)
+        with self.tracer.span("write_text", category="persist", path=path):
+            self._write(location, text.encode("utf-8"))
+
+    def write_json(self, path: str, obj: Any) -> None:
+        location = archive_location(path)
+        if location is None:
+            return super().write_json(path, obj)
+        with self.tracer.span("write_json", category="persist", path=path):
+            self._write(location, json.dumps(obj, ensure_ascii=False, indent=4).encode("utf-8"))
+
+    def save_image(self, path: str, image, timings: Dict[str, float] = None) -> None:
+        location = archive_location(path)
+        if location is None:
+            return super().save_image(path, image, timings)
+        with self.tracer.span("save_image", category="persist", path=path):
+            encode_start = time.perf_counter()
+            data = self.screenshot_codec.encode(image)
+            if timings is not None:
+                timings["screenshot_encode"] = time.perf_counter() - encode_start
+            self._write(location, data)
+
+    def flush(self) -> int:
+        with self._lock:
+            archives, self._archives = self._archives, {}
+        for archive in archives.values():
+            archive.close()
+        return 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+class TraceArchive:
+    """
+    Read access to the captured_data.zip of an episode, see TraceArchiveWriter.
+
+    Members are read in place through the zip offset table, nothing is extracted.
+    """
+    def __init__(self, path: str) -> None:
+        if os.path.isdir(path):
+            path = os.path.join(path, ARCHIVE_NAME)
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        # {step: {kind: member}}, kind being the directory of the member (screenshot, vh, action...)
+        self.members: Dict[int, Dict[str, str]] = {}
+        self.other_members: List[str] = []
+        for member in dict.fromkeys(self._zip.namelist()):
+            kind, _, name = member.partition("/")
+            stem = os.path.splitext(name)[0]
+            if stem.isdigit():
+                self.members.setdefault(int(stem), {})[kind] = member
+            else:
+                self.other_members.append(member)
+
+    def __enter__(self) -> "TraceArchive":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def steps(self) -> List[int]:
+        return sorted(self.members)
+
+    def read(self, member: str) -> bytes:
+        return self._zip.read(member)
+
+    def step(self, k: int) -> Dict[str, Any]:
+        """
+        The artifacts of step k, decoded: "screenshot" as a PIL image (whatever its codec), "vh" and "action_target" as
+        JSON, the others (xml, activity, action, chat...) as text.
+
+        Raises:
+            KeyError: the archive has no artifact of step k.
+        """
+        artifacts = {}
+        for kind, member in self.members[k].items():
+            data = self.read(member)
+            if kind == "screenshot":
+                artifacts[kind] = decode_screenshot(data, member)
+            elif kind in ("vh", "action_target"):
+                artifacts[kind] = json.loads(data)
+            else:
+                artifacts[kind] = data.decode("utf-8")
+        return artifacts
+
+    def export(self, episode_dir: str = None) -> str:
+        """
+        Write the artifacts back to the directory layout of ArtifactWriter,
+        <episode_dir>/captured_data/<kind>/<step>.<ext>.
+
+        Args:
+            episode_dir (str): Directory receiving captured_data, by default the one holding the archive.
+
+        Returns:
+            str: The captured_data directory.
+        """
+        episode_dir = episode_dir or os.path.dirname(self.path)
+        output_path = os.path.join(episode_dir, "captured_data")
+        self._zip.extractall(output_path)
+        return output_path
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+def export_trace_archive(archive_path: str, episode_dir: str = None) -> str:
+    """Extract the captured_data.zip at archive_path (or in the episode directory archive_path), see TraceArchive.export."""
+    with TraceArchive(archive_path) as archive:
+        return archive.export(episode_dir)
+
+
+class EpisodeArtifacts:
+    """
+    The artifacts of a recorded episode, whether in a captured_data directory or a captured_data.zip.
+    steps is {step: {kind: path}}, paths being those AgentEnv writes, <episode_dir>/captured_data/<kind>/<step>.<ext>.
+    """
+    def __init__(self, episode_dir: str) -> None:
+        self.episode_dir = episode_dir
+        self.captured_data_path = os.path.join(episode_dir, "captured_data")
+        archive_path = os.path.join(episode_dir, ARCHIVE_NAME)
+        self._archive = zipfile.ZipFile(archive_path, "r") if os.path.exists(archive_path) else None
+        if self._archive is not None:
+            names = [name.split("/", 1) for name in self._archive.namelist() if "/" in name]
+        else:
+            names = [(entry.name, name) for entry in os.scandir(self.captured_data_path) if entry.is_dir()
+                     for name in os.listdir(entry.path)]
+        self.steps: Dict[int, Dict[str, str]] = {}
+        for kind, name in names:
+            stem = os.path.splitext(name)[0]
+            if stem.isdigit():
+                self.steps.setdefault(int(stem), {})[kind] = os.path.join(self.captured_data_path, kind, name)
+
+    def __enter__(self) -> "EpisodeArtifacts":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    @staticmethod
+    def modified_at(episode_dir: str) -> float:
+        """Last modification time of the artifacts of an episode (of its archive or captured_data directories)."""
+        archive_path = os.path.join(episode_dir, ARCHIVE_NAME)
+        if os.path.exists(archive_path):
+            return os.path.getmtime(archive_path)
+        captured_data_path = os.path.join(episode_dir, "captured_data")
+        return max([os.path.getmtime(entry.path) for entry in os.scandir(captured_data_path) if entry.is_dir()] or [0])
+
+    def read(self, path: str) -> bytes:
+        if self._archive is not None:
+            return self._archive.read(os.path.relpath(path, self.captured_data_path).replace(os.sep, "/"))
+        with open(path, "rb") as file:
+            return file.read()
+
+    def read_text(self, path: str) -> str:
+        return self.read(path).decode("utf-8")
+
+    def close(self) -> None:
+        if self._archive is not None:
+            self._archive.close()
+
+
+def iter_episode_dirs(root: str) -> Iterator[str]:
+    """The recorded episodes of a captured_data tree, root/<category>/<episode>, directories or archives."""
+    for category in sorted(os.listdir(root)):
+        category_path = os.path.join(root, category)
+        if not os.path.isdir(category_path):
+            continue
+        for episode in sorted(os.listdir(category_path)):
+            episode_dir = os.path.join(category_path, episode)
+            if (os.path.isdir(os.path.join(episode_dir, "captured_data"))
+                    or os.path.exists(os.path.join(episode_dir, ARCHIVE_NAME))):
+                yield episode_dir
@@ -0,0 +1,233 @@
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from typing import Any, Dict, List, Tuple
+
+from utils.parse_action import parse_action_record
+from utils.trace_archive import EpisodeArtifacts, iter_episode_dirs
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    output_path TEXT PRIMARY KEY,
+    run TEXT,
+    category TEXT,
+    episode TEXT,
+    steps INTEGER,
+    final_action_type TEXT,
+    hit_max_steps INTEGER,
+    indexed_at REAL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    output_path TEXT NOT NULL,
+    run TEXT,
+    episode TEXT,
+    step INTEGER NOT NULL,
+    action_type TEXT,
+    touch_x REAL,
+    touch_y REAL,
+    lift_x REAL,
+    lift_y REAL,
+    typed_text TEXT,
+    activity TEXT,
+    vh_hash TEXT,
+    screenshot_path TEXT,
+    xml_path TEXT,
+    vh_path TEXT,
+    activity_path TEXT,
+    action_path TEXT,
+    PRIMARY KEY (output_path, step)
+);
+CREATE INDEX IF NOT EXISTS episodes_episode ON episodes (episode);
+CREATE INDEX IF NOT EXISTS steps_episode ON steps (episode);
+CREATE INDEX IF NOT EXISTS steps_activity ON steps (activity);
+CREATE INDEX IF NOT EXISTS steps_action_type ON steps (action_type);
+CREATE INDEX IF NOT EXISTS steps_vh_hash ON steps (vh_hash);
+"""
+
+# final actions of an episode the agent ended itself
+_END_ACTION_TYPES = ("STATUS_TASK_COMPLETE", "STATUS_TASK_IMPOSSIBLE")
+
+
+def episode_key(episode_dir: str) -> Tuple[str, str, str, str]:
+    """
+    (output_path, run, category, episode) of the episode recorded in episode_dir,
+    <run>/<category>/<episode>: output_path and run are absolute so that every run has its own rows.
+    """
+    output_path = os.path.abspath(episode_dir)
+    category_path, episode = os.path.split(output_path)
+    run, category = os.path.split(category_path)
+    return output_path, run, category, episode
+
+
+def view_hierarchy_hash(view_hierarchy: str) -> str:
+    """Digest of a view hierarchy XML, equal for identical screens."""
+    return hashlib.sha1(view_hierarchy.encode("utf-8")).hexdigest()[:16]
+
+
+class TraceIndex:
+    """
+    SQLite index of the episodes and steps in captured_data, for queries across runs such as
+    "the steps where activity X appeared" or "the episodes that hit max_steps".
+
+    One row per step holds the recorded action (type, normalized points, text), the top activity,
+    a hash of the view hierarchy and the paths of the artifacts; one row per episode holds its
+    length and how it ended. Rows are keyed by the absolute output path of the episode,
+    <run>/<category>/<episode>, and carry its run (the captured_data root) and episode id, so the
+    same episode recorded by several runs has one row per run. AgentEnv fills it as it writes the
+    artifacts, backfill indexes captured_data trees written before (or without the index). The
+    database is in WAL mode and every call is its own transaction, so the workers of an EmulatorPool
+    can share it.
+    """
+    def __init__(self, path: str) -> None:
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # AgentEnvs are built in one thread and run in another, calls are serialized by _lock
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(episodes)")]
+        if columns and "run" not in columns:
+            # index of an older version keyed by episode id only, rebuild it with backfill
+            self.logger.warning(f"{path} has the old episode-keyed schema, its tables are dropped; run backfill again")
+            self._connection.executescript("DROP TABLE IF EXISTS steps; DROP TABLE IF EXISTS episodes;")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, parameters: Tuple = ()) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(sql, parameters)
+
+    def add_state(self, episode_dir: str, step: int, activity: str, view_hierarchy: str, paths: Dict[str, str]) -> None:
+        """
+        Index the state get_state saved at step of the episode recorded in episode_dir.
+
+        Args:
+            paths (dict): Paths of the "screenshot", "xml", "vh" and "activity" artifacts.
+        """
+        output_path, run, _, episode = episode_key(episode_dir)
+        self._execute(
+            "INSERT INTO steps (output_path, run, episode, step, activity, vh_hash, screenshot_path, xml_path, vh_path, "
+            "activity_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (output_path, step) DO UPDATE SET "
+            "activity = excluded.activity, vh_hash = excluded.vh_hash, screenshot_path = excluded.screenshot_path, "
+            "xml_path = excluded.xml_path, vh_path = excluded.vh_path, activity_path = excluded.activity_path",
+            (output_path, run, episode, step, activity.strip(), view_hierarchy_hash(view_hierarchy),
+             paths.get("screenshot"), paths.get("xml"), paths.get("vh"), paths.get("activity")),
+        )
+
+    def add_action(self, episode_dir: str, step: int, action: str, action_path: str = None) -> None:
+        """Index the action recorded at step of the episode recorded in episode_dir, see parse_action_record."""
+        output_path, run, _, episode = episode_key(episode_dir)
+        record = parse_action_record(action)
+        touch_x, touch_y = record.touch_point or (None, None)
+        lift_x, lift_y = record.lift_point or (None, None)
+        self._execute(
+            "INSERT INTO steps (output_path, run, episode, step, action_type, touch_x, touch_y, lift_x, lift_y, "
+            "typed_text, action_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (output_path, step) DO UPDATE "
+            "SET action_type = excluded.action_type, touch_x = excluded.touch_x, touch_y = excluded.touch_y, "
+            "lift_x = excluded.lift_x, lift_y = excluded.lift_y, typed_text = excluded.typed_text, "
+            "action_path = excluded.action_path",
+            (output_path, run, episode, step, record.action_type, touch_x, touch_y, lift_x, lift_y, record.typed_text,
+             action_path),
+        )
+
+    def add_episode(self, episode_dir: str, max_steps: int = None) -> None:
+        """
+        Index an episode whose steps are indexed: its length, its last action and whether it was
+        stopped by max_steps (max_steps actions, the last one not ending the task).
+        """
+        output_path, run, category, episode = episode_key(episode_dir)
+        with self._lock, self._connection:
+            steps, final_action_type = self._connection.execute(
+                "SELECT COUNT(action_type), (SELECT action_type FROM steps WHERE output_path = ? AND action_type IS NOT NULL "
+                "ORDER BY step DESC LIMIT 1) FROM steps WHERE output_path = ?", (output_path, output_path)).fetchone()
+            hit_max_steps = (max_steps is not None and steps >= max_steps and final_action_type not in _END_ACTION_TYPES)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO episodes (output_path, run, category, episode, steps, final_action_type, "
+                "hit_max_steps, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (output_path, run, category, episode, steps, final_action_type, int(hit_max_steps), time.time()),
+            )
+
+    def remove_episode(self, episode_dir: str) -> None:
+        """Forget the episode recorded in episode_dir and its steps, e.g. before it is run again there."""
+        output_path = episode_key(episode_dir)[0]
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM steps WHERE output_path = ?", (output_path,))
+            self._connection.execute("DELETE FROM episodes WHERE output_path = ?", (output_path,))
+
+    def index_episode(self, episode_dir: str, max_steps: int = None) -> int:
+        """
+        Index a recorded episode, <category>/<episode> with a captured_data directory or archive.
+
+        Returns:
+            int: Number of steps indexed.
+        """
+        artifacts = EpisodeArtifacts(episode_dir)
+        self.remove_episode(episode_dir)
+        try:
+            for step, paths in sorted(artifacts.steps.items()):
+                if "xml" in paths:
+                    activity = artifacts.read_text(paths["activity"]) if "activity" in paths else ""
+                    self.add_state(episode_dir, step, activity, artifacts.read_text(paths["xml"]), paths)
+                if "action" in paths:
+                    self.add_action(episode_dir, step, artifacts.read_text(paths["action"]), paths["action"])
+        finally:
+            artifacts.close()
+        self.add_episode(episode_dir, max_steps)
+        return len(artifacts.steps)
+
+    def backfill(self, root: str, max_steps: int = None, reindex: bool = False) -> int:
+        """
+        Index the episodes of a captured_data tree, root/<category>/<episode>. Episodes indexed
+        after their artifacts were last modified are skipped unless reindex is set.
+
+        Returns:
+            int: Number of episodes indexed.
+        """
+        with self._lock:
+            indexed_at = dict(self._connection.execute("SELECT output_path, indexed_at FROM episodes"))
+        indexed = 0
+        for episode_dir in iter_episode_dirs(root):
+            output_path = episode_key(episode_dir)[0]
+            if (not reindex and output_path in indexed_at
+                    and indexed_at[output_path] >= EpisodeArtifacts.modified_at(episode_dir)):
+                continue
+            try:
+                steps = self.index_episode(episode_dir, max_steps)
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                self.logger.error(f"can not index {episode_dir}: {e}")
+                continue
+            self.logger.debug(f"indexed {episode_dir}: {steps} steps")
+            indexed += 1
+        self.logger.info(f"indexed {indexed} episodes of {root}")
+        return indexed
+
+    def query(self, sql: str, parameters: Tuple = ()) -> List[Tuple[Any, ...]]:
+        """
+        Rows of a query, e.g. `query("SELECT run, episode, step FROM steps WHERE activity LIKE ?", ("%Settings%",))`.
+        """
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("index captured_data trees into an SQLite database")
+    parser.add_argument("roots", nargs="+", help="captured_data trees, <root>/<category>/<episode>/captured_data")
+    parser.add_argument("--db", default="trace_index.sqlite", help="the index database")
+    parser.add_argument("--max-steps", type=int, default=None, help="MAX_STEPS of the runs, to flag the episodes that hit it")
+    parser.add_argument("--reindex", action="store_true", help="index episodes again even if unchanged")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    trace_index = TraceIndex(args.db)
+    for root in args.roots:
+        trace_index.backfill(root, max_steps=args.max_steps, reindex=args.reindex)
+    trace_index.close()
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+
+class _NullSpan:
+    """Context manager doing nothing, shared by every span of a disabled Tracer."""
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.category, self.start, end, self.args)
+
+
+class Tracer:
+    """
+    Collect timed spans as Chrome trace events ("X" complete events, microseconds).
+
+    A disabled tracer hands out one shared no-op context manager, so spans left in the code cost a
+    method call when tracing is off. Events are kept in memory until flush appends them to a
+    timeline.jsonl file, one event per line; to_chrome_trace turns such a file into a trace that
+    chrome://tracing or Perfetto open.
+    """
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def span(self, name: str, category: str = "env", **args: Any):
+        """
+        Context manager timing its block, e.g. `with tracer.span("get_state", step=3): ...`.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def record(self, name: str, category: str, start_ns: int, end_ns: int, args: Dict[str, Any] = None) -> None:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start_ns // 1000,
+            "dur": (end_ns - start_ns) // 1000,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._events.append(event)
+
+    def flush(self, path: str) -> int:
+        """
+        Append the collected events to the timeline file at path and forget them.
+
+        Returns:
+            int: Number of events written.
+        """
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a", encoding="utf-8") as file:
+            for event in events:
+                file.write(json.dumps(event, default=str))
+                file.write("\n")
+        return len(events)
+
+
+class TracedDevice:
+    """
+    Proxy of a device putting every public method call in a "device" span of tracer.
+    Attributes that are not methods (serial, u2d...) are passed through.
+    """
+    def __init__(self, device, tracer: Tracer) -> None:
+        self._device = device
+        self._tracer = tracer
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._device, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+        tracer = self._tracer
+
+        def traced(*args, **kwargs):
+            with tracer.span(name, category="device"):
+                return attribute(*args, **kwargs)
+        return traced
+
+
+def to_chrome_trace(timeline_path: str, output_path: str) -> None:
+    """Convert a timeline.jsonl file to the JSON object format of Chrome traces."""
+    with open(timeline_path, "r", encoding="utf-8") as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    with open(output_path, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
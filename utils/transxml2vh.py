@@ -1,70 +1,103 @@
+import re
 import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+_BOUNDS_RE = re.compile(r"\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]")
+
+
+def convert_bounds(bounds_str):
+    """Convert bounds from string format '[x0,y0][x1,y1]' to a list [[x0, y0], [x1, y1]]"""
+    if bounds_str:
+        parts = bounds_str.replace('[', '').split(']')
+        start = list(map(int, parts[0].split(',')))
+        end = list(map(int, parts[1].split(',')))
+        return [start, end]
+    return [[0, 0], [0, 0]]
+
+
+def _parse_error(error):
+    """The ET.ParseError ET.fromstring raises for an expat error."""
+    parse_error = ET.ParseError(str(error))
+    parse_error.code = error.code
+    parse_error.position = error.lineno, error.offset
+    return parse_error
+
 
 def xml_string_to_json(xml_string):
-    root = ET.fromstring(xml_string) 
-    node_id = 0 
-    json_list = []  
+    """
+    Convert a uiautomator2 view hierarchy dump to a list of node dicts ordered by temp_id.
 
+    The dump is streamed through expat, configured as ElementTree configures it (namespace
+    separator, undefined entities), so attribute values are normalized the same way as by
+    ET.fromstring, but no element tree is built: nodes are numbered in pre-order when their start
+    tag is seen, which is also the order they are appended in, and the parents of the open elements
+    are kept on a stack.
 
-    def process_node(node, parent_id=-1):
-        nonlocal node_id
-        current_id = node_id
-        node_id += 1  
-        
+    Raises:
+        ET.ParseError: the dump is not well-formed XML.
+    """
+    json_list = []
+    stack = [] # node dicts of the currently open elements
+    bounds_match = _BOUNDS_RE.fullmatch
 
+    def start_element(tag, attrs):
+        get = attrs.get
+        current_id = len(json_list)
+        bounds = get('bounds', '')
+        match = bounds_match(bounds)
+        if stack:
+            parent = stack[-1]
+            parent_id = parent["temp_id"]
+            parent["children"].append(current_id)
+        else:
+            parent_id = -1
         node_dict = {
-            "bounds": convert_bounds(node.get('bounds', '')),
-            "checkable": node.get('checkable', 'false') == 'true',
-            "checked": node.get('checked', 'false') == 'true',
-            "children": [],          
-            "class": node.get('class',None),
-            "clickable": node.get('clickable', 'false') == 'true',     
-            "content_description": node.get('content-desc', None),
-            "editable": False, 
-            "enabled": node.get('enabled', 'true') == 'true',
-            "focusable": node.get('focusable', 'false') == 'true',
-            "focused": node.get('focused', 'false') == 'true',
-            "is_password": node.get('password', 'false') == 'true',
-            "long_clickable": node.get('long-clickable', 'false') == 'true',
-            "package": node.get('package', ''),
+            "bounds": ([[int(match[1]), int(match[2])], [int(match[3]), int(match[4])]] if match
+                       else convert_bounds(bounds)),
+            "checkable": get('checkable') == 'true',
+            "checked": get('checked') == 'true',
+            "children": [],
+            "class": get('class', None),
+            "clickable": get('clickable') == 'true',
+            "content_description": get('content-desc', None),
+            "editable": False,
+            "enabled": get('enabled', 'true') == 'true',
+            "focusable": get('focusable') == 'true',
+            "focused": get('focused') == 'true',
+            "is_password": get('password') == 'true',
+            "long_clickable": get('long-clickable') == 'true',
+            "package": get('package', ''),
             "parent": parent_id,
-            "resource_id": node.get('resource-id', None),
-            "scrollable": node.get('scrollable', 'false') == 'true',
-            "selected": node.get('selected', 'false') == 'true',
+            "resource_id": get('resource-id', None),
+            "scrollable": get('scrollable') == 'true',
+            "selected": get('selected') == 'true',
             "size": "1080*2400",
-            "temp_id": current_id, 
-            "text": node.get('text', None),
-            "visible": True, 
-           
+            "temp_id": current_id,
+            "text": get('text', None),
+            "visible": True,
         }
-        
-
-        child_nodes = list(node)
-        node_dict["child_count"] = len(child_nodes)
-        
-        child_ids = []
-        for child in child_nodes:
-            child_dict = process_node(child, parent_id=current_id)
-            child_ids.append(child_dict["temp_id"])
-        node_dict["children"] = child_ids
-
         json_list.append(node_dict)
-        return node_dict
-    
-
-    def convert_bounds(bounds_str):
-        """Convert bounds from string format '[x0,y0][x1,y1]' to a list [[x0, y0], [x1, y1]]"""
-        if bounds_str:
-            parts = bounds_str.replace('[', '').split(']')
-            start = list(map(int, parts[0].split(',')))
-            end = list(map(int, parts[1].split(',')))
-            return [start, end]
-        return [[0, 0], [0, 0]]
-
+        stack.append(node_dict)
 
-    process_node(root)
-    # Sort list of nodes by temp_id in ascending order
-    sorted_json_list = sorted(json_list, key=lambda x: x['temp_id'])
-    return sorted_json_list
+    def end_element(tag):
+        node_dict = stack.pop()
+        node_dict["child_count"] = len(node_dict["children"])
 
+    def undefined_entity(text):
+        # what ElementTree does with the entity references a DTD leaves to the application
+        if text[:1] == "&":
+            error = expat.error(f"undefined entity {text}: line {parser.CurrentLineNumber}, "
+                                f"column {parser.CurrentColumnNumber}")
+            error.code, error.lineno, error.offset = 11, parser.CurrentLineNumber, parser.CurrentColumnNumber
+            raise error
 
+    parser = expat.ParserCreate(None, "}")
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    if ("<!DOCTYPE" if isinstance(xml_string, str) else b"<!DOCTYPE") in xml_string:
+        parser.DefaultHandlerExpand = undefined_entity
+    try:
+        parser.Parse(xml_string, True)
+    except expat.error as e:
+        raise _parse_error(e) from None
+    return json_list
@@ -0,0 +1,51 @@
+import logging
+import time
+
+
+class UISettleDetector:
+    """
+    Decide that the screen is stable after an action instead of sleeping for a fixed time.
+
+    The detector polls a cheap fingerprint of the UI (a hash of the compressed view hierarchy) and
+    returns as soon as it stays unchanged for `stable_polls` consecutive polls, never earlier than
+    `min_wait` and never later than `max_wait` seconds after the action.
+    """
+    def __init__(self, device, min_wait: float = 0.5, max_wait: float = 5.0, poll_interval: float = 0.25,
+                 stable_polls: int = 2) -> None:
+        self.device = device
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.stable_polls = stable_polls
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def wait_for_settle(self) -> tuple[float, bool]:
+        """
+        Block until the UI is stable.
+
+        Returns:
+            tuple: (seconds waited, whether the UI was stable or max_wait was hit).
+        """
+        start_time = time.time()
+        time.sleep(self.min_wait)
+        last_fingerprint = None
+        unchanged = 0
+        while True:
+            try:
+                fingerprint = self.device.get_ui_fingerprint()
+            except Exception as e:
+                self.logger.debug(f"failed to get UI fingerprint: {e}")
+                fingerprint = None
+            if fingerprint is not None and fingerprint == last_fingerprint:
+                unchanged += 1
+                if unchanged >= self.stable_polls - 1:
+                    return time.time() - start_time, True
+            else:
+                unchanged = 0
+            last_fingerprint = fingerprint
+            if time.time() - start_time + self.poll_interval > self.max_wait:
+                remaining = self.max_wait - (time.time() - start_time)
+                if remaining > 0:
+                    time.sleep(remaining)
+                return time.time() - start_time, False
+            time.sleep(self.poll_interval)